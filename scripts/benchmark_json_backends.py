@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare the JSON backends available to reconstruct_threads.py on a real
+monthly dump.
+
+Usage example:
+
+    python3 scripts/benchmark_json_backends.py \
+        years/2008/comments/raw/comments_2008-01.bz2 --limit 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+from typing import List
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.compressed_io import iter_lines
+from scripts.json_decoding import available_backends, get_decoder
+from scripts.reconstruct_threads import parse_comment_lines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Time each installed JSON backend on raw comment lines."
+    )
+    parser.add_argument(
+        "input_path",
+        type=Path,
+        help="Raw comments_<YYYY-MM> dump (.jsonl, .bz2, .gz or .zst).",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=200_000,
+        help="Number of lines to load into memory and decode (default: 200,000).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Timed runs per backend; the fastest is reported.",
+    )
+    return parser.parse_args()
+
+
+def best_of(repeat: int, func) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    args = parse_args()
+    if not args.input_path.exists():
+        raise FileNotFoundError(f"Input file not found: {args.input_path}")
+
+    lines: List[bytes] = [
+        line for line in islice(iter_lines(args.input_path), args.limit) if line.strip()
+    ]
+    if not lines:
+        raise ValueError(f"No records found in {args.input_path}")
+    megabytes = sum(len(line) for line in lines) / 1e6
+    print(f"Loaded {len(lines):,} lines ({megabytes:,.1f} MB) from {args.input_path}")
+    print(f"{'backend':<10} {'decode only':>14} {'decode + store':>16}")
+
+    for backend in available_backends():
+        decode = get_decoder(backend)
+        decode_seconds = best_of(args.repeat, lambda: [decode(line) for line in lines])
+        store_seconds = best_of(
+            args.repeat, lambda: parse_comment_lines(lines, json_backend=backend)
+        )
+        print(
+            f"{backend:<10} {len(lines) / decode_seconds:>10,.0f} l/s "
+            f"{len(lines) / store_seconds:>12,.0f} l/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,42 @@ from __future__ import annotations
 
 import argparse
 import json
+import sys
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.compressed_io import iter_lines, open_text
+from scripts.comment_store import CommentStore
+from scripts.json_decoding import BACKENDS
+from scripts.parallel import ordered_imap
+from scripts.reconstruct_threads import (
+    ChildIndex,
+    RecordFilter,
+    ThreadBatch,
+    ThreadPlan,
+    attach_children,
+    is_deleted_body,
+    iter_thread_batches,
+    parse_subreddits,
+    plan_threads,
+    read_comments,
+)
+from scripts.reddit_ids import decode_id
+from scripts.thread_store import (
+    ThreadStore,
+    decode_thread,
+    is_thread_store,
+    read_thread_header,
+)
+
+THREADS_PER_BATCH = 256
+RAW_REPORT_EVERY = 250_000
 
 
 def parse_args() -> argparse.Namespace:
@@ -19,12 +53,15 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "threads_path",
         type=Path,
-        help="Path to threads_<YYYY-MM>.jsonl produced by reconstruct_threads.py",
+        help="Path to threads_<YYYY-MM>.jsonl (or .npz thread store) produced by "
+        "reconstruct_threads.py, or with --from-raw a raw dump such as "
+        "comments_<YYYY-MM>.bz2 (read directly, like reconstruct_threads.py)",
     )
     parser.add_argument(
         "output_path",
         type=Path,
-        help="Destination JSONL file containing one document per thread.",
+        help="Destination JSONL file containing one document per thread "
+        "(compressed if it ends in .zst, .gz or .bz2).",
     )
     parser.add_argument(
         "--min-comments",
@@ -42,16 +79,51 @@ def parse_args() -> argparse.Namespace:
         "--report-every",
         type=int,
         default=5_000,
-        help="Print progress after processing this many threads.",
+        help="Print progress after processing this many threads. With --from-raw, "
+        f"loading the dump reports every {RAW_REPORT_EVERY:,} comments as "
+        "reconstruct_threads.py does; this flag only counts threads.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parse threads and join their text in this many processes. "
+        "Documents are written in input order, identical to a serial run.",
+    )
+    parser.add_argument(
+        "--from-raw",
+        action="store_true",
+        help="Read a raw comment dump and build documents straight from it, "
+        "without writing or parsing nested thread JSON. Documents match "
+        "reconstruct_threads.py followed by this script.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--subreddit",
+        type=parse_subreddits,
+        default=None,
+        help="With --from-raw: only keep comments from these subreddits "
+        "(case-insensitive, comma-separated).",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=BACKENDS,
+        default="auto",
+        help="With --from-raw: JSON parser for raw records (default: orjson if "
+        "installed, then pysimdjson, then the stdlib json module).",
+    )
+    args = parser.parse_args()
+    if not args.from_raw and (args.subreddit or args.json_backend != "auto"):
+        parser.error("--subreddit and --json-backend only apply with --from-raw")
+    return args
 
 
 def iter_comments(node: Dict) -> Iterable[Dict]:
     """Depth-first traversal yielding every comment node in the thread tree."""
-    yield node
-    for child in node.get("children", []):
-        yield from iter_comments(child)
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.get("children", [])))
 
 
 def extract_comment_text(comment: Dict) -> Optional[str]:
@@ -70,41 +142,271 @@ def aggregate_thread_text(thread: Dict) -> str:
     return "\n".join(parts).strip()
 
 
+def aggregate_store_text(store: ThreadStore, idx: int) -> str:
+    """``aggregate_thread_text`` read straight from a thread store's columns."""
+    parts: List[str] = []
+    for body, cleaned in zip(*store.bodies(idx)):
+        text = (cleaned or body or "").strip()
+        if text:
+            parts.append(text)
+    return "\n".join(parts).strip()
+
+
+def iter_thread_texts(threads_path: Path) -> Iterator[Tuple[Dict, Callable[[], str]]]:
+    """
+    Yield (thread fields, text getter) per thread; the text is only joined
+    for threads that pass the filters. JSONL records are decoded in full only
+    then, and thread stores skip building comment dicts altogether.
+    """
+    if is_thread_store(threads_path):
+        store = ThreadStore(threads_path)
+        for idx in range(len(store)):
+            yield store.header(idx), partial(aggregate_store_text, store, idx)
+        return
+    for line in iter_lines(threads_path):
+        if line.strip():
+            yield read_thread_header(line), partial(aggregate_line_text, line)
+
+
+def aggregate_line_text(line: bytes) -> str:
+    return aggregate_thread_text(decode_thread(line))
+
+
+def raw_thread_rows(
+    plan: ThreadPlan,
+    store: CommentStore,
+    children: ChildIndex,
+) -> Tuple[List[int], int]:
+    """
+    Rows of the comments that survive deletion pruning, in the pre-order of
+    the reconstructed thread, and the number of surviving roots. This is the
+    traversal of ``build_pruned_trees`` without building any nodes.
+    """
+    rows: List[int] = []
+    root_count = 0
+    stack: List[Tuple[int, bool]] = [(row, True) for row in reversed(plan.roots)]
+    while stack:
+        row, is_root = stack.pop()
+        replies = children.children(row)
+        if is_deleted_body(store.body.get(row)):
+            # Replies slide up into the deleted comment's place.
+            stack.extend((child_row, is_root) for child_row in reversed(replies))
+            continue
+
+        rows.append(row)
+        root_count += is_root
+        stack.extend((child_row, False) for child_row in reversed(replies))
+    return rows, root_count
+
+
+def aggregate_raw_text(store: CommentStore, rows: List[int]) -> str:
+    """``aggregate_thread_text`` over comment store rows."""
+    parts: List[str] = []
+    for row in rows:
+        text = (store.body_cleaned.get(row) or store.body.get(row) or "").strip()
+        if text:
+            parts.append(text)
+    return "\n".join(parts).strip()
+
+
+def raw_thread_document(
+    plan: ThreadPlan,
+    store: CommentStore,
+    children: ChildIndex,
+    min_comments: int,
+) -> Optional[str]:
+    rows, root_count = raw_thread_rows(plan, store, children)
+    if not rows:
+        return None
+
+    thread = {
+        "link_id": decode_id(plan.link_id),
+        "subreddit": store.subreddit.get(rows[0]),
+        "comment_count": len(rows),
+        "root_count": root_count,
+        "created_utc_min": plan.created_utc_min,
+        "created_utc_max": plan.created_utc_max,
+    }
+    return build_document(thread, partial(aggregate_raw_text, store, rows), min_comments)
+
+
+def _documents_from_batch(task: Tuple[ThreadBatch, int]) -> List[Optional[str]]:
+    batch, min_comments = task
+    return [
+        raw_thread_document(plan, batch.store, batch.children, min_comments)
+        for plan in batch.plans
+    ]
+
+
+def iter_raw_documents(
+    input_path: Path,
+    min_comments: int,
+    report_every: int = RAW_REPORT_EVERY,
+    subreddits: Optional[FrozenSet[str]] = None,
+    workers: int = 1,
+    json_backend: str = "auto",
+) -> Iterator[Optional[str]]:
+    """
+    One serialized document per submission of a raw dump (None where it was
+    skipped), in the chronological order reconstruct_threads.py writes
+    threads in. Comment text is read from the columnar store, so no nested
+    thread is ever built or serialized.
+    """
+    store = read_comments(
+        input_path,
+        report_every=report_every,
+        record_filter=RecordFilter(subreddits=subreddits),
+        workers=workers,
+        json_backend=json_backend,
+    )
+    children = attach_children(store)
+    # A thread never has more surviving comments than the submission has
+    # comments, so the raw count is a safe first cut.
+    plans = plan_threads(store, children, min_comments)
+    if workers <= 1:
+        for plan in plans:
+            yield raw_thread_document(plan, store, children, min_comments)
+        return
+
+    tasks = (
+        (batch, min_comments)
+        for batch in iter_thread_batches(plans, store, children)
+    )
+    for documents in ordered_imap(_documents_from_batch, tasks, workers=workers):
+        yield from documents
+
+
+def build_document(
+    thread: Dict,
+    thread_text: Callable[[], str],
+    min_comments: int,
+) -> Optional[str]:
+    """Serialized document for ``thread``, or None if it is filtered out or empty."""
+    if thread["comment_count"] < min_comments:
+        return None
+
+    text = thread_text()
+    if not text:
+        return None
+
+    record = {
+        "link_id": thread["link_id"],
+        "subreddit": thread["subreddit"],
+        "comment_count": thread["comment_count"],
+        "root_count": thread["root_count"],
+        "created_utc_min": thread["created_utc_min"],
+        "created_utc_max": thread["created_utc_max"],
+        "text": text,
+    }
+    return json.dumps(record)
+
+
+def _documents_from_lines(task: Tuple[List[bytes], int]) -> List[Optional[str]]:
+    lines, min_comments = task
+    documents = []
+    for line in lines:
+        documents.append(
+            build_document(
+                read_thread_header(line), partial(aggregate_line_text, line), min_comments
+            )
+        )
+    return documents
+
+
+@lru_cache(maxsize=1)
+def _worker_store(path: Path) -> ThreadStore:
+    # Only the link_id index is read here; each task decodes its own group.
+    return ThreadStore(path)
+
+
+def _documents_from_store(task: Tuple[Path, int, int]) -> List[Optional[str]]:
+    path, group, min_comments = task
+    store = _worker_store(path)
+    return [
+        build_document(
+            store.header(idx), partial(aggregate_store_text, store, idx), min_comments
+        )
+        for idx in store.group_threads(group)
+    ]
+
+
+def _iter_line_batches(path: Path) -> Iterator[List[bytes]]:
+    batch: List[bytes] = []
+    for line in iter_lines(path):
+        if not line.strip():
+            continue
+        batch.append(line)
+        if len(batch) >= THREADS_PER_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_documents(
+    threads_path: Path,
+    min_comments: int,
+    workers: int = 1,
+) -> Iterator[Optional[str]]:
+    """
+    One serialized document per thread (None where it was skipped), in
+    input order. With ``workers > 1`` batches of threads are parsed and
+    joined in a process pool.
+    """
+    if workers <= 1:
+        for thread, thread_text in iter_thread_texts(threads_path):
+            yield build_document(thread, thread_text, min_comments)
+        return
+
+    if is_thread_store(threads_path):
+        # One task per row group, so a worker only ever decodes the groups
+        # it is handed rather than the whole store.
+        groups = ThreadStore(threads_path).group_count
+        tasks: Iterable = (
+            (threads_path, group, min_comments) for group in range(groups)
+        )
+        build_batch = _documents_from_store
+    else:
+        tasks = (
+            (batch, min_comments) for batch in _iter_line_batches(threads_path)
+        )
+        build_batch = _documents_from_lines
+    for documents in ordered_imap(build_batch, tasks, workers=workers):
+        yield from documents
+
+
 def main() -> None:
     args = parse_args()
     if not args.threads_path.exists():
-        raise FileNotFoundError(f"Threads file not found: {args.threads_path}")
+        kind = "Raw dump" if args.from_raw else "Threads file"
+        raise FileNotFoundError(f"{kind} not found: {args.threads_path}")
+    # --from-raw cuts submissions on their raw comment count before any
+    # thread is rebuilt, so it counts those rather than threads.
+    considered = "submissions with enough raw comments" if args.from_raw else "threads"
 
     args.output_path.parent.mkdir(parents=True, exist_ok=True)
 
     total_threads = 0
     written_docs = 0
-    with args.threads_path.open("r", encoding="utf-8") as reader, args.output_path.open(
-        "w", encoding="utf-8"
-    ) as writer:
-        for line in reader:
-            if not line.strip():
-                continue
-            thread = json.loads(line)
+    with open_text(args.output_path, "w") as writer:
+        if args.from_raw:
+            documents = iter_raw_documents(
+                args.threads_path,
+                args.min_comments,
+                subreddits=args.subreddit,
+                workers=args.workers,
+                json_backend=args.json_backend,
+            )
+        else:
+            documents = iter_documents(
+                args.threads_path, args.min_comments, workers=args.workers
+            )
+        for document in documents:
             total_threads += 1
-
-            if thread["comment_count"] < args.min_comments:
-                continue
-
-            text = aggregate_thread_text(thread)
-            if not text:
+            if document is None:
                 continue
 
-            record = {
-                "link_id": thread["link_id"],
-                "subreddit": thread["subreddit"],
-                "comment_count": thread["comment_count"],
-                "root_count": thread["root_count"],
-                "created_utc_min": thread["created_utc_min"],
-                "created_utc_max": thread["created_utc_max"],
-                "text": text,
-            }
-            writer.write(json.dumps(record))
+            writer.write(document)
             writer.write("\n")
             written_docs += 1
 
@@ -113,12 +415,14 @@ def main() -> None:
 
             if total_threads % args.report_every == 0:
                 print(
-                    f"Processed {total_threads:,} threads | documents written: {written_docs:,}",
+                    f"Processed {total_threads:,} {considered} | "
+                    f"documents written: {written_docs:,}",
                     flush=True,
                 )
 
     print(
-        f"Finished. Considered {total_threads:,} threads, wrote {written_docs:,} documents.",
+        f"Finished. Considered {total_threads:,} {considered}, "
+        f"wrote {written_docs:,} documents.",
         flush=True,
     )
 
@@ -0,0 +1,131 @@
+"""
+Checkpoints for long single-dump reconstruction runs.
+
+A checkpoint directory holds ``state.json`` and one ``segment-NNNNN.npz``
+per stretch of the dump ingested so far (a saved :class:`CommentStore`).
+The state records how far ingestion got (lines and bytes consumed) and,
+once the threads are being written, how many submissions were handled and
+how long the output file was at that point. A resumed run loads the
+segments, continues reading after the recorded position, truncates the
+output to its last checkpointed length and skips the submissions already
+written.
+
+Only directories that are empty, missing or already hold ``state.json``
+are used, and only the files named here (``state.json`` and the segments)
+are ever deleted, so pointing ``--checkpoint-dir`` at a directory with
+other contents is refused rather than wiped.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List
+
+from scripts.comment_store import CommentStore
+
+STATE_NAME = "state.json"
+CHECKPOINT_VERSION = 1
+
+
+@dataclass
+class RunCheckpoint:
+    directory: Path
+    settings: Dict
+    lines: int = 0
+    byte_offset: int = 0
+    segments: int = 0
+    ingest_done: bool = False
+    plans_done: int = 0
+    threads_written: int = 0
+    output_bytes: int = 0
+    created_directory: bool = False
+
+    @classmethod
+    def open(cls, directory: Path, settings: Dict, resume: bool) -> "RunCheckpoint":
+        """
+        Load the checkpoint in ``directory`` when resuming, or start a new
+        one (discarding any stale checkpoint) otherwise.
+        """
+        state_path = directory / STATE_NAME
+        if resume and state_path.exists():
+            with state_path.open("r", encoding="utf-8") as handle:
+                state = json.load(handle)
+            if state.pop("version", None) != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version in {state_path}")
+            if state["settings"] != settings:
+                raise ValueError(
+                    f"Checkpoint in {directory} was written for a different input "
+                    "or different options; rerun without --resume to start over."
+                )
+            return cls(directory=directory, **state)
+
+        if resume:
+            print(f"No checkpoint in {directory}; starting from scratch.", flush=True)
+        created_directory = not directory.exists()
+        if state_path.exists():
+            # A stale checkpoint of ours: keep whether we created its directory.
+            with state_path.open("r", encoding="utf-8") as handle:
+                created_directory = json.load(handle).get("created_directory", False)
+            _remove_checkpoint_files(directory)
+        elif not created_directory and any(directory.iterdir()):
+            raise ValueError(
+                f"{directory} is not empty and holds no checkpoint; choose a new "
+                "or empty --checkpoint-dir."
+            )
+        directory.mkdir(parents=True, exist_ok=True)
+        checkpoint = cls(
+            directory=directory, settings=settings, created_directory=created_directory
+        )
+        checkpoint.save()
+        return checkpoint
+
+    def save(self) -> None:
+        """Write ``state.json`` atomically."""
+        state = asdict(self)
+        state.pop("directory")
+        state["version"] = CHECKPOINT_VERSION
+        path = self.directory / STATE_NAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(state, handle, indent=2)
+            handle.write("\n")
+        os.replace(tmp_path, path)
+
+    def segment_path(self, idx: int) -> Path:
+        return self.directory / f"segment-{idx:05d}.npz"
+
+    def add_segment(self, store: CommentStore, lines: int, byte_offset: int) -> None:
+        """Persist the comments read since the last segment and the new position."""
+        path = self.segment_path(self.segments)
+        tmp_path = path.with_name(path.name + ".tmp")
+        store.save(tmp_path)
+        os.replace(tmp_path, path)
+        self.segments += 1
+        self.lines = lines
+        self.byte_offset = byte_offset
+        self.save()
+
+    def load_segments(self) -> List[CommentStore]:
+        return [CommentStore.load(self.segment_path(idx)) for idx in range(self.segments)]
+
+    def record_output(self, plans_done: int, threads_written: int, output_bytes: int) -> None:
+        self.plans_done = plans_done
+        self.threads_written = threads_written
+        self.output_bytes = output_bytes
+        self.save()
+
+    def remove(self) -> None:
+        """Delete the checkpoint's files, and its directory if this class created it."""
+        _remove_checkpoint_files(self.directory)
+        if self.created_directory and not any(self.directory.iterdir()):
+            self.directory.rmdir()
+
+
+def _remove_checkpoint_files(directory: Path) -> None:
+    for pattern in ("segment-*.npz", "segment-*.npz.tmp", STATE_NAME + ".tmp"):
+        for path in directory.glob(pattern):
+            path.unlink()
+    (directory / STATE_NAME).unlink(missing_ok=True)
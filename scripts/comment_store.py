@@ -0,0 +1,417 @@
+"""
+Columnar, array-backed storage for the raw comments of a monthly dump.
+
+Every comment is a row: numeric fields live in NumPy arrays, ids are packed
+into integers by ``scripts.reddit_ids``, repeated strings (subreddit,
+author, ...) are dictionary-encoded, and bodies are UTF-8 slices of one
+shared byte buffer. A month held this way needs a fraction of
+the memory of one Python object per comment.
+"""
+
+from __future__ import annotations
+
+import json
+from array import array
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from scripts.reddit_ids import encode_ids
+
+# Bodies can contain lone surrogates (JSON "\ud83d" escapes), which plain
+# UTF-8 refuses to encode; "surrogatepass" round-trips them unchanged.
+_TEXT_ERRORS = "surrogatepass"
+
+# Raw id strings are buffered and encoded this many rows at a time, so the
+# codec runs as a few NumPy passes while the pending strings stay small.
+ID_BATCH_ROWS = 1 << 16
+
+
+def _value_key(value: object) -> Tuple[type, Hashable]:
+    # True, 1 and 1.0 hash alike, but must stay distinct so `edited` values
+    # are written back exactly as they were read.
+    return value.__class__, value  # type: ignore[return-value]
+
+
+class Interner:
+    """Assign consecutive integer codes to distinct values."""
+
+    def __init__(self, values: Iterable[object] = ()) -> None:
+        self.values: List[object] = []
+        self._codes: Dict[Tuple[type, Hashable], int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: object) -> int:
+        key = _value_key(value)
+        code = self._codes.get(key)
+        if code is None:
+            code = len(self.values)
+            self._codes[key] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class TextColumn:
+    """Optional strings stored as slices of a single UTF-8 buffer."""
+
+    def __init__(
+        self,
+        buffer: Union[bytes, bytearray],
+        starts: np.ndarray,
+        lengths: np.ndarray,
+    ) -> None:
+        self.buffer = buffer
+        self.starts = starts
+        # A length of -1 marks a missing (None) value.
+        self.lengths = lengths
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def get(self, row: int) -> Optional[str]:
+        length = int(self.lengths[row])
+        if length < 0:
+            return None
+        start = int(self.starts[row])
+        return self.buffer[start : start + length].decode("utf-8", _TEXT_ERRORS)
+
+    def take(self, rows: np.ndarray) -> "TextColumn":
+        return TextColumn(self.buffer, self.starts[rows], self.lengths[rows])
+
+    def compact(self, rows: np.ndarray) -> "TextColumn":
+        """Like :meth:`take`, but copies only the selected bytes into a new buffer."""
+        starts = self.starts[rows]
+        lengths = self.lengths[rows]
+        sizes = np.maximum(lengths, 0).astype(np.int64)
+        new_starts = np.zeros(len(sizes), dtype=np.int64)
+        np.cumsum(sizes[:-1], out=new_starts[1:])
+        source = np.repeat(starts - new_starts, sizes) + np.arange(
+            int(sizes.sum()), dtype=np.int64
+        )
+        buffer = np.frombuffer(self.buffer, dtype=np.uint8)[source].tobytes()
+        return TextColumn(buffer, new_starts, lengths.copy())
+
+    @staticmethod
+    def concat(columns: Sequence["TextColumn"]) -> "TextColumn":
+        shifts = np.cumsum([0] + [len(column.buffer) for column in columns[:-1]])
+        return TextColumn(
+            b"".join(column.buffer for column in columns),
+            np.concatenate(
+                [column.starts + shift for column, shift in zip(columns, shifts)]
+            ).astype(np.int64),
+            np.concatenate([column.lengths for column in columns]).astype(np.int32),
+        )
+
+
+class CategoricalColumn:
+    """Dictionary-encoded column for low-cardinality values (subreddit, author, ...)."""
+
+    def __init__(self, codes: np.ndarray, values: List[object]) -> None:
+        self.codes = codes
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def get(self, row: int) -> object:
+        return self.values[self.codes[row]]
+
+    def take(self, rows: np.ndarray) -> "CategoricalColumn":
+        return CategoricalColumn(self.codes[rows], self.values)
+
+    def compact(self, rows: np.ndarray) -> "CategoricalColumn":
+        """Like :meth:`take`, but keeps only the values the selected rows use."""
+        used, codes = np.unique(self.codes[rows], return_inverse=True)
+        return CategoricalColumn(
+            codes.astype(np.int32), [self.values[code] for code in used.tolist()]
+        )
+
+    @staticmethod
+    def concat(columns: Sequence["CategoricalColumn"]) -> "CategoricalColumn":
+        interner = Interner()
+        codes = []
+        for column in columns:
+            remap = np.array(
+                [interner.code(value) for value in column.values], dtype=np.int32
+            )
+            codes.append(remap[column.codes] if len(remap) else column.codes)
+        return CategoricalColumn(
+            np.concatenate(codes).astype(np.int32), interner.values
+        )
+
+
+class CommentStore:
+    """
+    One row per comment. ``ids``, ``parent_ids`` and ``link_ids`` hold
+    :func:`scripts.reddit_ids.encode_id` codes, so a comment id and a
+    ``parent_id`` pointing at it compare equal as integers.
+    """
+
+    def __init__(
+        self,
+        *,
+        ids: np.ndarray,
+        parent_ids: np.ndarray,
+        link_ids: np.ndarray,
+        created_utc: np.ndarray,
+        score: np.ndarray,
+        controversiality: np.ndarray,
+        subreddit: CategoricalColumn,
+        author: CategoricalColumn,
+        distinguished: CategoricalColumn,
+        edited: CategoricalColumn,
+        body: TextColumn,
+        body_cleaned: TextColumn,
+    ) -> None:
+        self.ids = ids
+        self.parent_ids = parent_ids
+        self.link_ids = link_ids
+        self.created_utc = created_utc
+        self.score = score
+        self.controversiality = controversiality
+        self.subreddit = subreddit
+        self.author = author
+        self.distinguished = distinguished
+        self.edited = edited
+        self.body = body
+        self.body_cleaned = body_cleaned
+        self._id_order: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rows_for_ids(self, codes: np.ndarray) -> np.ndarray:
+        """Rows holding the given encoded comment ids, or -1 where not loaded."""
+        if self._id_order is None or self._sorted_ids is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+            self._sorted_ids = self.ids[self._id_order]
+        codes = np.asarray(codes, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(codes.shape, -1, dtype=np.int64)
+        sorted_ids = self._sorted_ids
+        positions = np.searchsorted(sorted_ids, codes)
+        positions[positions == len(sorted_ids)] = 0
+        found = sorted_ids[positions] == codes
+        return np.where(found, self._id_order[positions], -1)
+
+    def take(self, rows: np.ndarray) -> "CommentStore":
+        return CommentStore(
+            ids=self.ids[rows],
+            parent_ids=self.parent_ids[rows],
+            link_ids=self.link_ids[rows],
+            created_utc=self.created_utc[rows],
+            score=self.score[rows],
+            controversiality=self.controversiality[rows],
+            subreddit=self.subreddit.take(rows),
+            author=self.author.take(rows),
+            distinguished=self.distinguished.take(rows),
+            edited=self.edited.take(rows),
+            body=self.body.take(rows),
+            body_cleaned=self.body_cleaned.take(rows),
+        )
+
+    def compact(self, rows: np.ndarray) -> "CommentStore":
+        """
+        Self-contained copy of ``rows`` that owns only their text and
+        categorical values, cheap to pickle to a worker process.
+        """
+        return CommentStore(
+            ids=self.ids[rows],
+            parent_ids=self.parent_ids[rows],
+            link_ids=self.link_ids[rows],
+            created_utc=self.created_utc[rows],
+            score=self.score[rows],
+            controversiality=self.controversiality[rows],
+            subreddit=self.subreddit.compact(rows),
+            author=self.author.compact(rows),
+            distinguished=self.distinguished.compact(rows),
+            edited=self.edited.compact(rows),
+            body=self.body.compact(rows),
+            body_cleaned=self.body_cleaned.compact(rows),
+        )
+
+    def drop_duplicate_ids(self) -> "CommentStore":
+        """Keep only the last row for every comment id, as re-inserting into a dict would."""
+        reversed_ids = self.ids[::-1]
+        _, first_in_reversed = np.unique(reversed_ids, return_index=True)
+        if len(first_in_reversed) == len(self.ids):
+            return self
+        keep = np.sort(len(self.ids) - 1 - first_in_reversed)
+        return self.take(keep)
+
+    def save(self, path: Path) -> None:
+        """Write the store to an uncompressed ``.npz`` file (see :meth:`load`)."""
+        arrays: Dict[str, np.ndarray] = {
+            name: getattr(self, name) for name in _NUMERIC_COLUMNS
+        }
+        for name in _CATEGORICAL_COLUMNS:
+            column: CategoricalColumn = getattr(self, name)
+            arrays[f"{name}.codes"] = column.codes
+            # JSON keeps True, 1 and 1.0 apart, like the interner does.
+            arrays[f"{name}.values"] = np.array(json.dumps(column.values))
+        for name in _TEXT_COLUMNS:
+            text: TextColumn = getattr(self, name)
+            arrays[f"{name}.buffer"] = np.frombuffer(text.buffer, dtype=np.uint8)
+            arrays[f"{name}.starts"] = text.starts
+            arrays[f"{name}.lengths"] = text.lengths
+        with path.open("wb") as handle:
+            np.savez(handle, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "CommentStore":
+        with np.load(path) as data:
+            columns: Dict[str, object] = {name: data[name] for name in _NUMERIC_COLUMNS}
+            for name in _CATEGORICAL_COLUMNS:
+                columns[name] = CategoricalColumn(
+                    data[f"{name}.codes"], json.loads(str(data[f"{name}.values"]))
+                )
+            for name in _TEXT_COLUMNS:
+                columns[name] = TextColumn(
+                    data[f"{name}.buffer"].tobytes(),
+                    data[f"{name}.starts"],
+                    data[f"{name}.lengths"],
+                )
+        return cls(**columns)  # type: ignore[arg-type]
+
+    @staticmethod
+    def concat(stores: Sequence["CommentStore"]) -> "CommentStore":
+        """Merge per-chunk stores (in order) into one."""
+
+        def joined(arrays: List[np.ndarray], dtype: type) -> np.ndarray:
+            return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype)
+
+        return CommentStore(
+            ids=joined([s.ids for s in stores], np.int64),
+            parent_ids=joined([s.parent_ids for s in stores], np.int64),
+            link_ids=joined([s.link_ids for s in stores], np.int64),
+            created_utc=joined([s.created_utc for s in stores], np.int64),
+            score=joined([s.score for s in stores], np.int32),
+            controversiality=joined([s.controversiality for s in stores], np.int8),
+            subreddit=CategoricalColumn.concat([s.subreddit for s in stores]),
+            author=CategoricalColumn.concat([s.author for s in stores]),
+            distinguished=CategoricalColumn.concat([s.distinguished for s in stores]),
+            edited=CategoricalColumn.concat([s.edited for s in stores]),
+            body=TextColumn.concat([s.body for s in stores]),
+            body_cleaned=TextColumn.concat([s.body_cleaned for s in stores]),
+        )
+
+
+_NUMERIC_COLUMNS = (
+    "ids",
+    "parent_ids",
+    "link_ids",
+    "created_utc",
+    "score",
+    "controversiality",
+)
+_CATEGORICAL_COLUMNS = ("subreddit", "author", "distinguished", "edited")
+_TEXT_COLUMNS = ("body", "body_cleaned")
+
+
+class TextBuilder:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.starts = array("q")
+        self.lengths = array("i")
+
+    def append(self, value: Optional[str]) -> None:
+        self.starts.append(len(self.buffer))
+        if value is None:
+            self.lengths.append(-1)
+            return
+        encoded = value.encode("utf-8", _TEXT_ERRORS)
+        self.buffer += encoded
+        self.lengths.append(len(encoded))
+
+    def build(self) -> TextColumn:
+        return TextColumn(
+            self.buffer,
+            np.frombuffer(self.starts, dtype=np.int64),
+            np.frombuffer(self.lengths, dtype=np.int32),
+        )
+
+
+class CategoricalBuilder:
+    def __init__(self) -> None:
+        self.interner = Interner()
+        self.codes = array("i")
+
+    def append(self, value: object) -> None:
+        self.codes.append(self.interner.code(value))
+
+    def build(self) -> CategoricalColumn:
+        return CategoricalColumn(
+            np.frombuffer(self.codes, dtype=np.int32), self.interner.values
+        )
+
+
+class CommentStoreBuilder:
+    """Accumulate raw comment records into compact typed buffers."""
+
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.parent_ids = array("q")
+        self.link_ids = array("q")
+        self.created_utc = array("q")
+        self.score = array("i")
+        self.controversiality = array("b")
+        self.subreddit = CategoricalBuilder()
+        self.author = CategoricalBuilder()
+        self.distinguished = CategoricalBuilder()
+        self.edited = CategoricalBuilder()
+        self.body = TextBuilder()
+        self.body_cleaned = TextBuilder()
+        self._pending_ids: List[str] = []
+        self._pending_parent_ids: List[str] = []
+        self._pending_link_ids: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.created_utc)
+
+    def append(self, comment_id: str, record: Dict) -> None:
+        self._pending_ids.append(comment_id)
+        self._pending_parent_ids.append(record["parent_id"])
+        self._pending_link_ids.append(record["link_id"])
+        if len(self._pending_ids) >= ID_BATCH_ROWS:
+            self._encode_pending_ids()
+        self.created_utc.append(int(record["created_utc"]))
+        self.score.append(int(record.get("score", 0)))
+        self.controversiality.append(int(record.get("controversiality", 0)))
+        self.subreddit.append(record["subreddit"])
+        self.author.append(record.get("author"))
+        self.distinguished.append(record.get("distinguished"))
+        self.edited.append(record.get("edited"))
+        self.body.append(record.get("body"))
+        self.body_cleaned.append(record.get("body_cleaned"))
+
+    def _encode_pending_ids(self) -> None:
+        for codes, pending in (
+            (self.ids, self._pending_ids),
+            (self.parent_ids, self._pending_parent_ids),
+            (self.link_ids, self._pending_link_ids),
+        ):
+            codes.frombytes(encode_ids(pending).tobytes())
+            pending.clear()
+
+    def build(self) -> CommentStore:
+        self._encode_pending_ids()
+        return CommentStore(
+            ids=np.frombuffer(self.ids, dtype=np.int64),
+            parent_ids=np.frombuffer(self.parent_ids, dtype=np.int64),
+            link_ids=np.frombuffer(self.link_ids, dtype=np.int64),
+            created_utc=np.frombuffer(self.created_utc, dtype=np.int64),
+            score=np.frombuffer(self.score, dtype=np.int32),
+            controversiality=np.frombuffer(self.controversiality, dtype=np.int8),
+            subreddit=self.subreddit.build(),
+            author=self.author.build(),
+            distinguished=self.distinguished.build(),
+            edited=self.edited.build(),
+            body=self.body.build(),
+            body_cleaned=self.body_cleaned.build(),
+        )
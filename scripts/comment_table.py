@@ -0,0 +1,206 @@
+"""
+Per-comment Parquet export of reconstructed threads.
+
+Every surviving comment becomes one row carrying its thread context
+(link_id, root, depth, pre-order position, parent in the pruned tree), so
+analyses that work on comments can scan a few columns with predicate
+pushdown instead of re-parsing and walking the nested JSON. Rows are
+written as a hive-partitioned dataset, one ``month=YYYY-MM`` directory per
+calendar month of the comments' ``created_utc``; load it with
+``pyarrow.dataset.dataset(path, partitioning="hive")``. Part files are
+written to a fresh staging directory next to it (see ``scripts/staging.py``)
+and only moved into place once the export completes; each month written
+then replaces that month's directory from an earlier export, while other
+months are left alone. A failed run therefore leaves the previous export
+intact.
+
+``pyarrow`` is optional and only needed when the export is requested.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+from scripts.staging import make_staging_dir, move_into_place
+from scripts.thread_store import FlatThread
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed for --comments-parquet
+    pa = None
+    pq = None
+
+ROWS_PER_FILE = 250_000
+# Cap on rows buffered across all months. Threads arrive in order of their
+# first comment, so a month the run has moved past rarely fills up to
+# ROWS_PER_FILE on its own; its leftover rows are flushed early instead of
+# staying in memory until close().
+MAX_BUFFERED_ROWS = 500_000
+
+_STRING_COLUMNS = (
+    "link_id",
+    "subreddit",
+    "id",
+    "parent_id",
+    "tree_parent_id",
+    "root_id",
+    "author",
+    "distinguished",
+    "body",
+    "body_cleaned",
+)
+
+
+def _schema() -> "pa.Schema":
+    return pa.schema(
+        [
+            ("link_id", pa.string()),
+            ("subreddit", pa.string()),
+            ("id", pa.string()),
+            ("parent_id", pa.string()),
+            ("tree_parent_id", pa.string()),
+            ("root_id", pa.string()),
+            ("depth", pa.int32()),
+            ("position", pa.int32()),
+            ("author", pa.string()),
+            ("created_utc", pa.int64()),
+            ("net_votes", pa.int64()),
+            ("controversiality", pa.int8()),
+            ("distinguished", pa.string()),
+            ("edited", pa.bool_()),
+            ("edited_utc", pa.int64()),
+            ("body", pa.string()),
+            ("body_cleaned", pa.string()),
+        ]
+    )
+
+
+def comment_month(created_utc: int) -> str:
+    return datetime.fromtimestamp(created_utc, tz=timezone.utc).strftime("%Y-%m")
+
+
+def _utf8_safe(values: List[object]) -> List[object]:
+    # Bodies may carry lone surrogates, which Arrow strings cannot hold.
+    return [
+        value.encode("utf-8", "surrogatepass").decode("utf-8", "replace")
+        if isinstance(value, str)
+        else value
+        for value in values
+    ]
+
+
+class CommentTableWriter:
+    """
+    Buffer comment rows per month and flush them as Parquet part files.
+
+    A month is flushed when it reaches ``rows_per_file`` rows, and the
+    largest month is flushed whenever more than ``max_buffered_rows`` rows
+    are buffered in total.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        rows_per_file: int = ROWS_PER_FILE,
+        max_buffered_rows: int = MAX_BUFFERED_ROWS,
+    ) -> None:
+        if pa is None:
+            raise RuntimeError(
+                "pyarrow is required for the Parquet export (pip install pyarrow)."
+            )
+        self.output_dir = output_dir
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        self.buffered_rows = 0
+        self.schema = _schema()
+        self.buffers: Dict[str, Dict[str, List[object]]] = {}
+        self.parts: Dict[str, int] = {}
+        self.rows_written = 0
+        self.staging_dir = make_staging_dir(output_dir)
+
+    def add(self, thread: FlatThread) -> None:
+        header, nodes = thread.header, thread.nodes
+        depths: List[int] = []
+        roots: List[int] = []
+        for position, parent in enumerate(thread.parents):
+            if parent < 0:
+                depths.append(0)
+                roots.append(position)
+            else:
+                depths.append(depths[parent] + 1)
+                roots.append(roots[parent])
+
+            created_utc = nodes["created_utc"][position]
+            month = comment_month(created_utc)
+            buffer = self.buffers.get(month)
+            if buffer is None:
+                buffer = self.buffers[month] = {name: [] for name in self.schema.names}
+            edited = nodes["edited"][position]
+            row = {
+                "link_id": header["link_id"],
+                "subreddit": header["subreddit"],
+                "id": nodes["id"][position],
+                "parent_id": nodes["parent_id"][position],
+                "tree_parent_id": nodes["id"][parent] if parent >= 0 else None,
+                "root_id": nodes["id"][roots[position]],
+                "depth": depths[position],
+                "position": position,
+                "author": nodes["author"][position],
+                "created_utc": created_utc,
+                "net_votes": nodes["net_votes"][position],
+                "controversiality": nodes["controversiality"][position],
+                "distinguished": nodes["distinguished"][position],
+                "edited": bool(edited),
+                "edited_utc": (
+                    int(edited)
+                    if isinstance(edited, (int, float)) and not isinstance(edited, bool)
+                    else None
+                ),
+                "body": nodes["body"][position],
+                "body_cleaned": nodes["body_cleaned"][position],
+            }
+            for name, value in row.items():
+                buffer[name].append(value)
+            self.buffered_rows += 1
+            if len(buffer["id"]) >= self.rows_per_file:
+                self._flush(month)
+            elif self.buffered_rows > self.max_buffered_rows:
+                self._flush(max(self.buffers, key=lambda m: len(self.buffers[m]["id"])))
+
+    def _flush(self, month: str) -> None:
+        buffer = self.buffers.pop(month)
+        self.buffered_rows -= len(buffer["id"])
+        arrays = []
+        for column in self.schema:
+            values = buffer[column.name]
+            if column.name in _STRING_COLUMNS:
+                try:
+                    arrays.append(pa.array(values, type=column.type))
+                    continue
+                except (UnicodeEncodeError, pa.ArrowInvalid):
+                    values = _utf8_safe(values)
+            arrays.append(pa.array(values, type=column.type))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+        part = self.parts.get(month, 0)
+        self.parts[month] = part + 1
+        month_dir = self.staging_dir / f"month={month}"
+        month_dir.mkdir(parents=True, exist_ok=True)
+        pq.write_table(table, month_dir / f"part-{part:05d}.parquet")
+        self.rows_written += table.num_rows
+
+    def close(self) -> None:
+        for month in sorted(self.buffers):
+            self._flush(month)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for month in sorted(self.parts):
+            name = f"month={month}"
+            move_into_place(self.staging_dir / name, self.output_dir / name)
+        self.staging_dir.rmdir()
+        print(
+            f"Wrote {self.rows_written:,} comment rows to {self.output_dir}",
+            flush=True,
+        )
@@ -0,0 +1,167 @@
+"""
+Line readers for the raw Politosphere dumps that work directly on the
+compressed archives (.bz2, .gz, .zst) as well as on plain JSONL files, and
+a matching text opener so every JSONL the scripts read or write (threads,
+corpora) can be compressed just by giving it one of those extensions.
+"""
+
+from __future__ import annotations
+
+import bz2
+import gzip
+import io
+import queue
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, TextIO
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst inputs
+    zstandard = None
+
+COMPRESSED_SUFFIXES = (".bz2", ".gz", ".zst")
+
+# zstd level 3 with one worker thread per core compresses faster than the
+# scripts produce JSON; gzip has no threaded encoder in the stdlib, so use
+# a mid level rather than the slow default of 9.
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+_LINE_BATCH_SIZE = 2_048
+_QUEUE_BATCHES = 64
+_END = object()
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix.lower() in COMPRESSED_SUFFIXES
+
+
+def open_binary(path: Path) -> BinaryIO:
+    """Open ``path`` for binary reading, decompressing based on its extension."""
+    suffix = path.suffix.lower()
+    if suffix == ".bz2":
+        return bz2.open(path, "rb")
+    if suffix == ".gz":
+        return gzip.open(path, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(
+                f"Reading {path} requires the zstandard package "
+                "(python3 -m pip install --user zstandard)."
+            )
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2**31)
+        return io.BufferedReader(
+            decompressor.stream_reader(path.open("rb"), closefd=True)
+        )
+    return path.open("rb")
+
+
+def open_text(path: Path, mode: str = "r") -> TextIO:
+    """
+    Open a UTF-8 text file for reading (``"r"``) or writing (``"w"``),
+    compressing or decompressing based on its extension.
+    """
+    if mode not in ("r", "w"):
+        raise ValueError(f"Unsupported mode: {mode!r}")
+    if mode == "r":
+        if not is_compressed(path):
+            return path.open("r", encoding="utf-8")
+        return io.TextIOWrapper(open_binary(path), encoding="utf-8")
+
+    suffix = path.suffix.lower()
+    if suffix == ".bz2":
+        return bz2.open(path, "wt", encoding="utf-8")
+    if suffix == ".gz":
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(
+                f"Writing {path} requires the zstandard package "
+                "(python3 -m pip install --user zstandard)."
+            )
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1)
+        writer = compressor.stream_writer(path.open("wb"), closefd=True)
+        return io.TextIOWrapper(writer, encoding="utf-8")  # type: ignore[arg-type]
+    return path.open("w", encoding="utf-8")
+
+
+def _produce_batches(
+    path: Path,
+    batches: "queue.Queue[object]",
+    stop: threading.Event,
+) -> None:
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        with open_binary(path) as handle:
+            batch: List[bytes] = []
+            for line in handle:
+                batch.append(line)
+                if len(batch) >= _LINE_BATCH_SIZE:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch and not put(batch):
+                return
+    except BaseException as exc:  # surfaced again in the consuming thread
+        put(exc)
+        return
+    put(_END)
+
+
+def iter_lines(path: Path) -> Iterator[bytes]:
+    """
+    Yield raw lines (as bytes) from ``path``.
+
+    Compressed inputs are decompressed in a background thread that hands
+    batches of lines to the caller through a bounded queue, so decompression
+    overlaps with JSON parsing instead of requiring a separate unpack step.
+    """
+    if not is_compressed(path):
+        with path.open("rb") as handle:
+            yield from handle
+        return
+
+    batches: "queue.Queue[object]" = queue.Queue(maxsize=_QUEUE_BATCHES)
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce_batches,
+        args=(path, batches, stop),
+        name=f"decompress-{path.name}",
+        daemon=True,
+    )
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield from item  # type: ignore[misc]
+    finally:
+        stop.set()
+        producer.join()
+
+
+def iter_lines_from(path: Path, line_offset: int = 0, byte_offset: int = 0) -> Iterator[bytes]:
+    """
+    Resume :func:`iter_lines` part-way through ``path``. Plain files seek to
+    ``byte_offset``; compressed streams cannot seek, so they are decompressed
+    again and the first ``line_offset`` lines are skipped.
+    """
+    if not is_compressed(path):
+        with path.open("rb") as handle:
+            handle.seek(byte_offset)
+            yield from handle
+        return
+    yield from islice(iter_lines(path), line_offset, None)
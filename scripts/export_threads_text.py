@@ -6,7 +6,6 @@ Bulk-export every reconstructed Reddit thread into its own text file.
 from __future__ import annotations
 
 import argparse
-import json
 import sys
 from pathlib import Path
 
@@ -16,6 +15,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from scripts.thread_render import render_thread
+from scripts.thread_store import iter_threads
 
 
 def parse_args() -> argparse.Namespace:
@@ -25,7 +25,7 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "threads_path",
         type=Path,
-        help="Path to the JSONL produced by reconstruct_threads.py.",
+        help="Path to the JSONL (or .npz thread store) produced by reconstruct_threads.py.",
     )
     parser.add_argument(
         "output_dir",
@@ -61,18 +61,14 @@ def export_threads(args: argparse.Namespace) -> int:
     args.output_dir.mkdir(parents=True, exist_ok=True)
 
     exported = 0
-    with args.threads_path.open("r", encoding="utf-8") as handle:
-        for line_no, line in enumerate(handle):
-            if not line.strip():
-                continue
-            thread = json.loads(line)
-            content = render_thread(thread, max_body_chars=args.max_body_chars)
-            filename = f"{line_no:06d}_{sanitize_filename(thread['link_id'])}.txt"
-            out_path = args.output_dir / filename
-            out_path.write_text(content + "\n", encoding="utf-8")
-            exported += 1
-            if args.limit and exported >= args.limit:
-                break
+    for thread_no, thread in enumerate(iter_threads(args.threads_path)):
+        content = render_thread(thread, max_body_chars=args.max_body_chars)
+        filename = f"{thread_no:06d}_{sanitize_filename(thread['link_id'])}.txt"
+        out_path = args.output_dir / filename
+        out_path.write_text(content + "\n", encoding="utf-8")
+        exported += 1
+        if args.limit and exported >= args.limit:
+            break
 
     return exported
 
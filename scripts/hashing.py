@@ -0,0 +1,16 @@
+"""Content hashes of input files, shared by the incremental state and the LDA cache."""
+
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+_HASH_BLOCK_BYTES = 1 << 20
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for block in iter(lambda: handle.read(_HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
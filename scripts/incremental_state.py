@@ -0,0 +1,114 @@
+"""
+On-disk state for incremental thread reconstruction.
+
+A state directory holds the raw comments of every dump processed so far,
+sharded into link_id buckets, the reconstructed threads of each bucket, and
+``manifest.json``: the reconstruction settings plus one entry (resolved
+path, size, mtime, SHA-256) per processed dump. Re-running with the same
+state directory only partitions dumps the manifest does not know yet.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from scripts.hashing import file_sha256
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class InputRecord:
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+
+
+@dataclass
+class StateManifest:
+    settings: Dict
+    inputs: List[InputRecord] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, state_dir: Path) -> Optional["StateManifest"]:
+        path = state_dir / MANIFEST_NAME
+        if not path.exists():
+            return None
+        with path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported state manifest version in {path}")
+        return cls(
+            settings=data["settings"],
+            inputs=[InputRecord(**entry) for entry in data["inputs"]],
+        )
+
+    def save(self, state_dir: Path) -> None:
+        """Write the manifest atomically, so an interrupted run leaves the old one."""
+        path = state_dir / MANIFEST_NAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "inputs": [asdict(entry) for entry in self.inputs],
+        }
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            json.dump(data, handle, indent=2)
+            handle.write("\n")
+        os.replace(tmp_path, path)
+
+    def check_settings(self, settings: Dict) -> None:
+        for key, value in settings.items():
+            if self.settings.get(key) != value:
+                raise ValueError(
+                    f"State directory was built with {key}={self.settings.get(key)!r}, "
+                    f"not {value!r}; use a fresh --state-dir to change it."
+                )
+
+    def find_new_inputs(self, input_paths: List[Path]) -> List[Path]:
+        """
+        Inputs not processed yet, in the given order. A dump whose size and
+        mtime match its manifest entry is trusted without hashing; otherwise
+        it is hashed, and a known hash (e.g. a moved or re-downloaded copy)
+        only refreshes the entry. A known path with new content is an error,
+        since its old comments are already in the buckets.
+        """
+        by_path = {entry.path: entry for entry in self.inputs}
+        by_hash = {entry.sha256: entry for entry in self.inputs}
+        new_paths: List[Path] = []
+        for input_path in input_paths:
+            resolved = str(input_path.resolve())
+            stat = input_path.stat()
+            known = by_path.get(resolved)
+            if known and known.size == stat.st_size and known.mtime_ns == stat.st_mtime_ns:
+                continue
+
+            digest = file_sha256(input_path)
+            if digest in by_hash:
+                entry = by_hash[digest]
+                by_path.pop(entry.path, None)
+                entry.path, entry.size, entry.mtime_ns = (
+                    resolved,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+                by_path[resolved] = entry
+                continue
+            if known:
+                raise ValueError(
+                    f"{input_path} changed since it was processed; rebuild the "
+                    "state directory from scratch."
+                )
+
+            entry = InputRecord(resolved, stat.st_size, stat.st_mtime_ns, digest)
+            self.inputs.append(entry)
+            by_path[resolved] = entry
+            by_hash[digest] = entry
+            new_paths.append(input_path)
+        return new_paths
@@ -0,0 +1,117 @@
+"""
+Pluggable decoders for raw Politosphere comment lines.
+
+``orjson`` and ``pysimdjson`` are optional; ``auto`` picks orjson when it is
+installed, then simdjson, then the stdlib ``json`` module. The simdjson
+decoder parses lazily and only materializes the fields thread
+reconstruction needs, so the unused Politosphere columns never become
+Python objects. Run ``benchmark_json_backends.py`` on a real month to see
+which backend wins on your machine.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Callable, Dict, List
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # optional dependency
+    simdjson = None
+
+# Fields read by CommentStoreBuilder.append and the record filters.
+COMMENT_FIELDS = (
+    "id",
+    "parent_id",
+    "link_id",
+    "subreddit",
+    "created_utc",
+    "score",
+    "controversiality",
+    "author",
+    "body",
+    "body_cleaned",
+    "distinguished",
+    "edited",
+)
+
+BACKENDS = ("auto", "orjson", "simdjson", "json")
+
+Decoder = Callable[[bytes], Dict]
+
+_MISSING = object()
+_decoders: Dict[str, Decoder] = {}
+
+
+def available_backends() -> List[str]:
+    """Concrete backends importable in this environment, in ``auto`` preference order."""
+    found = []
+    if orjson is not None:
+        found.append("orjson")
+    if simdjson is not None:
+        found.append("simdjson")
+    found.append("json")
+    return found
+
+
+def _simdjson_decoder() -> Decoder:
+    parser = simdjson.Parser()
+
+    def decode(line: bytes) -> Dict:
+        try:
+            document = parser.parse(line)
+        except ValueError:
+            # e.g. lone surrogate escapes, which json.loads accepts.
+            return json.loads(line)
+        record = {}
+        for name in COMMENT_FIELDS:
+            value = document.get(name, _MISSING)
+            if value is not _MISSING:
+                record[name] = value
+        # The parser can only be reused once the document proxy is gone.
+        del document
+        return record
+
+    return decode
+
+
+def _orjson_decoder() -> Decoder:
+    loads = orjson.loads
+
+    def decode(line: bytes) -> Dict:
+        try:
+            return loads(line)
+        except orjson.JSONDecodeError:
+            # orjson rejects lone surrogates and >64-bit integers.
+            return json.loads(line)
+
+    return decode
+
+
+def get_decoder(backend: str = "auto") -> Decoder:
+    """
+    Return a ``bytes -> dict`` decoder for raw comment lines. Every decoder
+    yields the same values for the fields in ``COMMENT_FIELDS``; the orjson
+    and stdlib decoders also keep the remaining fields.
+    """
+    if backend == "auto":
+        backend = available_backends()[0]
+    if backend not in _decoders:
+        if backend == "simdjson":
+            if simdjson is None:
+                raise RuntimeError("pysimdjson is not installed (pip install pysimdjson).")
+            _decoders[backend] = _simdjson_decoder()
+        elif backend == "orjson":
+            if orjson is None:
+                raise RuntimeError("orjson is not installed (pip install orjson).")
+            _decoders[backend] = _orjson_decoder()
+        elif backend == "json":
+            _decoders[backend] = json.loads
+        else:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+    return _decoders[backend]
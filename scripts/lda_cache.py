@@ -0,0 +1,168 @@
+"""
+Cache of vectorized LDA corpora.
+
+Tokenizing every document with ``CountVectorizer`` dominates short LDA
+runs, yet it only depends on the corpus file and the vectorizer settings.
+A cache entry is one ``.npz`` holding the CSR document-term matrix, the
+vocabulary and the per-document metadata. It is named after a fingerprint
+of the corpus contents (SHA-256) and those settings, so runs that only
+change LDA options reuse it, while an edited corpus or different
+vectorizer settings get an entry of their own.
+
+Streaming runs store the same matrix as a directory of row blocks instead
+(:class:`StreamedCorpus`), so it never has to fit in memory at once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from scripts.hashing import file_sha256
+from scripts.staging import make_staging_dir, move_into_place
+
+CACHE_VERSION = 1
+STREAMED_INDEX_NAME = "index.json"
+
+
+@dataclass
+class VectorizedCorpus:
+    doc_term: sparse.csr_matrix
+    feature_names: np.ndarray
+    meta: List[dict]
+
+    def save(self, path: Path) -> None:
+        """Write the entry atomically, so an interrupted run never leaves a partial one."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        _save_matrix(
+            tmp_path,
+            self.doc_term,
+            feature_names=np.array(json.dumps(self.feature_names.tolist())),
+            meta=np.array(json.dumps(self.meta)),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorizedCorpus":
+        with np.load(path) as data:
+            doc_term = _load_matrix(data)
+            feature_names = np.array(
+                json.loads(str(data["feature_names"])), dtype=object
+            )
+            meta = json.loads(str(data["meta"]))
+        return cls(doc_term=doc_term, feature_names=feature_names, meta=meta)
+
+
+def corpus_fingerprint(corpus_path: Path, settings: Dict) -> str:
+    """Key of the cache entry for ``corpus_path`` vectorized with ``settings``."""
+    payload = {
+        "version": CACHE_VERSION,
+        "corpus_sha256": file_sha256(corpus_path),
+        "settings": settings,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def cache_entry_path(cache_dir: Path, fingerprint: str) -> Path:
+    return cache_dir / f"doc_term-{fingerprint[:32]}.npz"
+
+
+def streamed_entry_path(cache_dir: Path, fingerprint: str) -> Path:
+    return cache_dir / f"doc_term-{fingerprint[:32]}.parts"
+
+
+def _save_matrix(path: Path, doc_term: sparse.csr_matrix, **extra: np.ndarray) -> None:
+    with path.open("wb") as handle:
+        np.savez(
+            handle,
+            data=doc_term.data,
+            indices=doc_term.indices,
+            indptr=doc_term.indptr,
+            shape=np.array(doc_term.shape, dtype=np.int64),
+            **extra,
+        )
+
+
+def _load_matrix(data: np.lib.npyio.NpzFile) -> sparse.csr_matrix:
+    return sparse.csr_matrix(
+        (data["data"], data["indices"], data["indptr"]),
+        shape=tuple(data["shape"].tolist()),
+    )
+
+
+@dataclass
+class StreamedCorpus:
+    """
+    A vectorized corpus on disk: ``part-NNNNN.npz`` files holding
+    consecutive rows of the document-term matrix with their documents'
+    metadata, plus ``index.json`` (vocabulary and counts).
+    """
+
+    directory: Path
+    feature_names: np.ndarray
+    parts: int
+    documents: int
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["StreamedCorpus"]:
+        """The corpus in ``directory``, or None if it was never completed."""
+        index_path = directory / STREAMED_INDEX_NAME
+        if not index_path.exists():
+            return None
+        with index_path.open("r", encoding="utf-8") as handle:
+            index = json.load(handle)
+        return cls(
+            directory=directory,
+            feature_names=np.array(index["feature_names"], dtype=object),
+            parts=index["parts"],
+            documents=index["documents"],
+        )
+
+    def part_path(self, idx: int) -> Path:
+        return self.directory / f"part-{idx:05d}.npz"
+
+    def iter_parts(self) -> Iterator[Tuple[sparse.csr_matrix, List[dict]]]:
+        for idx in range(self.parts):
+            with np.load(self.part_path(idx)) as data:
+                yield _load_matrix(data), json.loads(str(data["meta"]))
+
+
+class StreamedCorpusWriter:
+    """
+    Write a :class:`StreamedCorpus` part by part. Parts go to a fresh
+    staging directory that only replaces ``directory`` once it is complete.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.staging_dir = make_staging_dir(directory)
+        self.parts = 0
+        self.documents = 0
+
+    def add_part(self, doc_term: sparse.csr_matrix, meta: List[dict]) -> None:
+        path = self.staging_dir / f"part-{self.parts:05d}.npz"
+        _save_matrix(path, doc_term, meta=np.array(json.dumps(meta)))
+        self.parts += 1
+        self.documents += doc_term.shape[0]
+
+    def close(self, feature_names: np.ndarray) -> StreamedCorpus:
+        index = {
+            "feature_names": feature_names.tolist(),
+            "parts": self.parts,
+            "documents": self.documents,
+        }
+        with (self.staging_dir / STREAMED_INDEX_NAME).open("w", encoding="utf-8") as handle:
+            json.dump(index, handle)
+            handle.write("\n")
+        move_into_place(self.staging_dir, self.directory)
+        corpus = StreamedCorpus.load(self.directory)
+        assert corpus is not None
+        return corpus
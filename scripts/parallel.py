@@ -0,0 +1,42 @@
+"""
+Small helpers for fanning work out to a process pool while keeping results
+in input order.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_imap(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    *,
+    workers: int,
+    max_pending: Optional[int] = None,
+) -> Iterator[R]:
+    """
+    Apply ``func`` to every item in a process pool, yielding results in the
+    same order as ``items``.
+
+    At most ``max_pending`` tasks (default: two per worker) are in flight at
+    once, so ``items`` may be a lazy stream that does not fit in memory.
+    """
+    max_pending = max_pending or 2 * workers
+    pending: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for item in items:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
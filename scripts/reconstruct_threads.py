@@ -7,13 +7,72 @@ politosphere monthly comment dumps.
 from __future__ import annotations
 
 import argparse
+import heapq
 import json
-from collections import defaultdict
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
 from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.checkpoint import RunCheckpoint
+from scripts.comment_store import CommentStore, CommentStoreBuilder
+from scripts.comment_table import CommentTableWriter
+from scripts.compressed_io import is_compressed, iter_lines, iter_lines_from, open_text
+from scripts.incremental_state import StateManifest
+from scripts.json_decoding import BACKENDS, Decoder, get_decoder
+from scripts.parallel import ordered_imap
+from scripts.reddit_ids import (
+    SUBMISSION,
+    decode_id,
+    decode_ids,
+    encode_id,
+    encode_ids,
+    id_type,
+)
+from scripts.thread_store import (
+    FlatThread,
+    decode_thread,
+    flatten_thread,
+    is_thread_store,
+    write_thread_store,
+)
 
 DELETED_BODIES = {"[deleted]", "[removed]"}
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_BYTES = 1 << 20
+LINES_PER_BATCH = 20_000
+THREAD_BATCH_COMMENTS = 20_000
+DEFAULT_PARTITIONS = 64
+DEFAULT_CHECKPOINT_INTERVAL = 600.0
+
+# Serializes one thread payload for output: encode_thread (a JSON line) or
+# flatten_thread (a row group for a .npz thread store).
+ThreadEncoder = Callable[[Dict], object]
 
 
 def parse_args() -> argparse.Namespace:
@@ -21,20 +80,28 @@ def parse_args() -> argparse.Namespace:
         description="Rebuild Reddit thread trees from monthly JSONL comment dumps."
     )
     parser.add_argument(
-        "input_path",
+        "input_paths",
         type=Path,
-        help="Path to the raw comments_<YYYY-MM>.jsonl file.",
+        nargs="+",
+        metavar="input_path",
+        help="Raw comments_<YYYY-MM> dump(s): plain .jsonl or the compressed "
+        ".bz2/.gz/.zst archive (decompressed on the fly). Pass several months "
+        "to rebuild threads that cross month boundaries.",
     )
     parser.add_argument(
         "output_path",
         type=Path,
-        help="Destination JSONL file where reconstructed threads will be stored.",
+        help="Destination JSONL file where reconstructed threads will be stored "
+        "(compressed if it ends in .zst, .gz or .bz2). A path ending in .npz "
+        "writes the compact columnar thread store instead (see "
+        "scripts/thread_store.py).",
     )
     parser.add_argument(
         "--subreddit",
-        type=str,
+        type=parse_subreddits,
         default=None,
-        help="Only keep comments that match this subreddit name.",
+        help="Only keep comments from these subreddits (case-insensitive, "
+        "comma-separated, e.g. politics,politicaldiscussion).",
     )
     parser.add_argument(
         "--max-threads",
@@ -55,7 +122,134 @@ def parse_args() -> argparse.Namespace:
         default=250_000,
         help="Print progress every N processed comments.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Use this many processes to parse the raw dump (plain .jsonl "
+        "inputs are split into newline-aligned byte ranges, compressed inputs "
+        "are handed out in line batches) and to assemble and serialize "
+        "threads. Output is identical to a serial run.",
+    )
+    parser.add_argument(
+        "--prescan",
+        action="store_true",
+        help="Scan the dump once for per-submission comment counts and only "
+        "load full records for submissions that pass --min-comments. Implied "
+        "by --max-threads. Single-dump in-memory runs only.",
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        default=None,
+        help="Out-of-core mode: shard comments into this many on-disk link_id "
+        "buckets and reconstruct them one at a time, so memory is bounded by "
+        "the largest bucket instead of the whole dump. Always used when "
+        "several input dumps are given (default there: 64).",
+    )
+    parser.add_argument(
+        "--partition-workers",
+        type=int,
+        default=1,
+        help="Reconstruct this many partitions in parallel processes "
+        "(each holds one partition in memory). Needs --partitions, "
+        "--state-dir or several inputs.",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        type=Path,
+        default=None,
+        help="Directory for temporary partition files (default: next to the "
+        "output file). Needs --partitions or several inputs; not used with "
+        "--state-dir, which keeps its partitions in the state directory.",
+    )
+    parser.add_argument(
+        "--state-dir",
+        type=Path,
+        default=None,
+        help="Incremental mode: keep the link_id partitions and a manifest of "
+        "processed dumps in this directory. Later runs with the same directory "
+        "skip dumps already processed and only rebuild submissions touched by "
+        "new ones; the output always covers every dump processed so far.",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=BACKENDS,
+        default="auto",
+        help="JSON parser for raw records (default: orjson if installed, then "
+        "pysimdjson, then the stdlib json module).",
+    )
+    parser.add_argument(
+        "--comments-parquet",
+        type=Path,
+        default=None,
+        help="Also export one row per surviving comment, with its thread "
+        "context (link_id, root_id, depth, pre-order position, ...), as a "
+        "Parquet dataset partitioned by month under this directory. Needs "
+        "pyarrow.",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=None,
+        help="Save a checkpoint (comments parsed so far, then threads written "
+        "so far) every this many seconds, so an interrupted run can continue "
+        "with --resume. Single-dump, in-memory runs only.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run from its checkpoint (same input and "
+        "options). Keeps checkpointing, every 600 seconds unless "
+        "--checkpoint-interval says otherwise.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=Path,
+        default=None,
+        help="Where checkpoints live (default: <output_path>.checkpoint). Must be "
+        "new, empty or an earlier checkpoint; only the checkpoint's own files "
+        "are deleted after a successful run.",
+    )
+    args = parser.parse_args()
+    if (args.resume or args.checkpoint_interval is not None) and (
+        is_thread_store(args.output_path)
+        or is_compressed(args.output_path)
+        or args.comments_parquet
+    ):
+        parser.error(
+            "--resume/--checkpoint-interval need an uncompressed JSONL output "
+            "path and no --comments-parquet."
+        )
+    if (args.resume or args.checkpoint_interval is not None) and (
+        len(args.input_paths) > 1 or args.partitions or args.state_dir or args.prescan
+    ):
+        parser.error(
+            "--resume/--checkpoint-interval only apply to single-dump in-memory "
+            "runs (not --partitions, --state-dir, --prescan or several inputs)."
+        )
+    partitioned = len(args.input_paths) > 1 or args.partitions or args.state_dir
+    if args.prescan and partitioned:
+        parser.error(
+            "--prescan only applies to single-dump in-memory runs (not "
+            "--partitions, --state-dir or several inputs)."
+        )
+    if args.partition_workers != 1 and not partitioned:
+        parser.error(
+            "--partition-workers needs --partitions, --state-dir or several inputs."
+        )
+    if args.spill_dir and not (len(args.input_paths) > 1 or args.partitions):
+        parser.error("--spill-dir needs --partitions or several inputs.")
+    if args.spill_dir and args.state_dir:
+        parser.error("--spill-dir does not apply to --state-dir, which keeps its buckets.")
+    return args
+
+
+def parse_subreddits(value: str) -> FrozenSet[str]:
+    names = frozenset(name.strip().lower() for name in value.split(",") if name.strip())
+    if not names:
+        raise argparse.ArgumentTypeError("expected at least one subreddit name")
+    return names
 
 
 def normalize_comment_id(comment_id: str) -> str:
@@ -63,114 +257,463 @@ def normalize_comment_id(comment_id: str) -> str:
     return comment_id if comment_id.startswith("t1_") else f"t1_{comment_id}"
 
 
+# Top-level fields of a raw record, located without decoding the whole line.
+# A match is always a real key: quotes inside JSON string values are escaped.
+_LINK_ID_FIELD = re.compile(rb'"link_id"\s*:\s*"([^"\\]*)"')
+_CREATED_UTC_FIELD = re.compile(rb'"created_utc"\s*:\s*"?(-?\d+)')
+_SUBREDDIT_FIELD = re.compile(rb'"subreddit"\s*:\s*"([^"\\]*)"')
+
+
 @dataclass
-class CommentNode:
-    id: str
-    parent_id: str
-    link_id: str
-    subreddit: str
-    created_utc: int
-    score: int
-    controversiality: int
-    author: Optional[str]
-    body: Optional[str]
-    body_cleaned: Optional[str]
-    distinguished: Optional[str]
-    edited: Optional[bool]
-    children: List[str] = field(default_factory=list)
+class RecordFilter:
+    """
+    Which raw records to keep: optional lower-cased subreddit names and/or a
+    set of encoded link ids.
+    """
+
+    subreddits: Optional[FrozenSet[str]] = None
+    link_ids: Optional[Set[int]] = None
+    _subreddit_values: Optional[Pattern[bytes]] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.subreddits:
+            # Any of the names as a complete JSON string token. Body text
+            # cannot produce one, since quotes inside strings are escaped.
+            alternatives = b"|".join(
+                re.escape(name.encode()) for name in sorted(self.subreddits)
+            )
+            self._subreddit_values = re.compile(
+                b'"(?:' + alternatives + b')"', re.IGNORECASE
+            )
+
+    def accepts_line(self, line: bytes) -> bool:
+        """
+        Cheap byte-level check on the raw line, run before JSON decoding. It
+        may let through false positives (e.g. an author named like the
+        subreddit), which :meth:`accepts` then rejects.
+        """
+        if self._subreddit_values is not None and not self._subreddit_values.search(line):
+            return False
+        if self.link_ids is None:
+            return True
+        match = _LINK_ID_FIELD.search(line)
+        return match is None or encode_id(match.group(1).decode()) in self.link_ids
+
+    def accepts(self, record: Dict) -> bool:
+        if self.subreddits and record["subreddit"].lower() not in self.subreddits:
+            return False
+        if self.link_ids is not None and encode_id(record["link_id"]) not in self.link_ids:
+            return False
+        return True
+
+
+def decode_record(
+    line: bytes,
+    record_filter: Optional[RecordFilter],
+    decode: Decoder,
+) -> Optional[Dict]:
+    """Parse one raw line, or return None for blank lines and filtered records."""
+    if not line.strip():
+        return None
+    if record_filter is None:
+        return decode(line)
+    if not record_filter.accepts_line(line):
+        return None
+    record = decode(line)
+    return record if record_filter.accepts(record) else None
+
+
+def parse_comment_lines(
+    lines: Iterable[bytes],
+    record_filter: Optional[RecordFilter] = None,
+    json_backend: str = "auto",
+) -> CommentStore:
+    decode = get_decoder(json_backend)
+    builder = CommentStoreBuilder()
+    for line in lines:
+        record = decode_record(line, record_filter, decode)
+        if record is not None:
+            builder.append(normalize_comment_id(record["id"]), record)
+    return builder.build()
 
 
 def read_comments(
     input_path: Path,
     report_every: int,
-    subreddit_filter: Optional[str] = None,
-) -> Dict[str, CommentNode]:
-    lookup: Dict[str, CommentNode] = {}
-
-    with input_path.open("r", encoding="utf-8") as handle:
-        for idx, line in enumerate(handle, start=1):
-            if not line.strip():
-                continue
-
-            record = json.loads(line)
-            if subreddit_filter and record["subreddit"].lower() != subreddit_filter.lower():
+    record_filter: Optional[RecordFilter] = None,
+    workers: int = 1,
+    json_backend: str = "auto",
+) -> CommentStore:
+    if workers > 1:
+        store = _read_comments_parallel(
+            input_path,
+            report_every=report_every,
+            record_filter=record_filter,
+            workers=workers,
+            json_backend=json_backend,
+        )
+    else:
+        decode = get_decoder(json_backend)
+        builder = CommentStoreBuilder()
+        for idx, line in enumerate(iter_lines(input_path), start=1):
+            record = decode_record(line, record_filter, decode)
+            if record is None:
                 continue
 
-            comment_id = normalize_comment_id(record["id"])
-
-            lookup[comment_id] = CommentNode(
-                id=comment_id,
-                parent_id=record["parent_id"],
-                link_id=record["link_id"],
-                subreddit=record["subreddit"],
-                created_utc=int(record["created_utc"]),
-                score=int(record.get("score", 0)),
-                controversiality=int(record.get("controversiality", 0)),
-                author=record.get("author"),
-                body=record.get("body"),
-                body_cleaned=record.get("body_cleaned"),
-                distinguished=record.get("distinguished"),
-                edited=record.get("edited"),
-            )
+            builder.append(normalize_comment_id(record["id"]), record)
 
             if idx % report_every == 0:
                 print(f"Read {idx:,} comments...", flush=True)
+        store = builder.build()
+
+    store = store.drop_duplicate_ids()
+    print(f"Loaded {len(store):,} comments into memory.", flush=True)
+    return store
+
+
+def scan_link_fields(line: bytes) -> Optional[Tuple[str, int, str]]:
+    """(link_id, created_utc, subreddit) of a raw line, decoding JSON only as a fallback."""
+    link = _LINK_ID_FIELD.search(line)
+    created = _CREATED_UTC_FIELD.search(line)
+    subreddit = _SUBREDDIT_FIELD.search(line)
+    if link and created and subreddit:
+        return link.group(1).decode(), int(created.group(1)), subreddit.group(1).decode()
+    if not line.strip():
+        return None
+    record = json.loads(line)
+    return record["link_id"], int(record["created_utc"]), record["subreddit"]
 
-    print(f"Loaded {len(lookup):,} comments into memory.", flush=True)
-    return lookup
 
+def prescan_submissions(
+    input_path: Path,
+    report_every: int,
+    subreddits: Optional[FrozenSet[str]] = None,
+) -> Dict[int, List[int]]:
+    """
+    First, cheap pass over a dump: map every encoded link_id to
+    ``[comment_count, created_utc_min]`` without decoding full records.
+    """
+    stats: Dict[str, List[int]] = {}
+    line_filter = RecordFilter(subreddits=subreddits)
+    for idx, line in enumerate(iter_lines(input_path), start=1):
+        if not line_filter.accepts_line(line):
+            continue
+        fields = scan_link_fields(line)
+        if fields is None:
+            continue
+        link_id, created_utc, subreddit = fields
+        if subreddits and subreddit.lower() not in subreddits:
+            continue
+        entry = stats.get(link_id)
+        if entry is None:
+            stats[link_id] = [1, created_utc]
+        else:
+            entry[0] += 1
+            if created_utc < entry[1]:
+                entry[1] = created_utc
 
-def attach_children(lookup: Dict[str, CommentNode]) -> defaultdict[str, List[str]]:
-    children_map: defaultdict[str, List[str]] = defaultdict(list)
-    for comment in lookup.values():
-        children_map[comment.parent_id].append(comment.id)
+        if idx % report_every == 0:
+            print(f"Scanned {idx:,} comments...", flush=True)
 
-    for comment in lookup.values():
-        comment.children = sorted(
-            children_map.get(comment.id, []),
-            key=lambda cid: (lookup[cid].created_utc, lookup[cid].id),
+    print(f"Prescan found {len(stats):,} submissions.", flush=True)
+    return dict(zip(encode_ids(list(stats)).tolist(), stats.values()))
+
+
+def reconstruct_with_prescan(
+    input_path: Path,
+    *,
+    report_every: int,
+    subreddits: Optional[FrozenSet[str]],
+    workers: int,
+    max_threads: Optional[int],
+    min_comments: int,
+    json_backend: str = "auto",
+    encode: Optional[ThreadEncoder] = None,
+) -> Iterator[object]:
+    """
+    Two-phase reconstruction: count comments per submission with
+    :func:`prescan_submissions`, then load full records only for the
+    submissions that can still be written.
+
+    Submissions are loaded in chronological batches, so ``max_threads``
+    stops the run after the first few. This assumes every reply shares its
+    parent's link_id, which holds for Reddit data.
+    """
+    stats = prescan_submissions(input_path, report_every, subreddits)
+    candidates = [
+        link_code
+        for _, link_code in sorted(
+            (entry[1], link_code)
+            for link_code, entry in stats.items()
+            if entry[0] >= min_comments
         )
+    ]
+    del stats
+    print(
+        f"{len(candidates):,} submissions have at least {min_comments} comments.",
+        flush=True,
+    )
 
-    return children_map
+    emitted = 0
+    position = 0
+    take = 0
+    while position < len(candidates):
+        remaining = max_threads - emitted if max_threads else None
+        # Some candidates end up empty after deleted comments are dropped,
+        # so over-select, and at least double the batch every round: a run
+        # that keeps falling short still rescans the dump only a
+        # logarithmic number of times.
+        take = max(2 * remaining, 2 * take) if remaining else len(candidates)
+        batch = set(candidates[position : position + take])
+        position += take
 
+        store = read_comments(
+            input_path,
+            report_every=report_every,
+            record_filter=RecordFilter(subreddits=subreddits, link_ids=batch),
+            workers=workers,
+            json_backend=json_backend,
+        )
+        children = attach_children(store)
+        for line in reconstruct_thread_lines(
+            store,
+            children,
+            max_threads=remaining,
+            min_comments=min_comments,
+            workers=workers,
+            encode=encode,
+        ):
+            yield line
+            emitted += 1
+        if max_threads and emitted >= max_threads:
+            return
 
-def group_by_submission(comments: Dict[str, CommentNode]) -> defaultdict[str, List[str]]:
-    by_link: defaultdict[str, List[str]] = defaultdict(list)
-    for comment_id, comment in comments.items():
-        by_link[comment.link_id].append(comment_id)
-    return by_link
 
+def iter_byte_ranges(
+    input_path: Path,
+    chunk_count: int,
+    start: int = 0,
+) -> Iterator[Tuple[int, int]]:
+    """
+    Split a plain JSONL file (from byte ``start`` on) into roughly equal,
+    newline-aligned byte ranges.
+    """
+    size = input_path.stat().st_size
+    chunk_size = max(MIN_CHUNK_BYTES, (size - start) // max(chunk_count, 1) + 1)
+    with input_path.open("rb") as handle:
+        while start < size:
+            handle.seek(min(start + chunk_size, size))
+            handle.readline()
+            end = handle.tell()
+            yield start, end
+            start = end
 
-def build_tree(
-    comment_id: str,
-    lookup: Dict[str, CommentNode],
-) -> Dict:
-    comment = lookup[comment_id]
-    return {
-        "id": comment.id,
-        "parent_id": comment.parent_id,
-        "author": comment.author,
-        "body": comment.body,
-        "body_cleaned": comment.body_cleaned,
-        "net_votes": comment.score,
-        "controversiality": comment.controversiality,
-        "created_utc": comment.created_utc,
-        "distinguished": comment.distinguished,
-        "edited": comment.edited,
-        "children": [build_tree(child_id, lookup) for child_id in comment.children],
-    }
+
+def _parse_byte_range(
+    task: Tuple[Path, int, int, Optional[RecordFilter], str],
+) -> Tuple[int, CommentStore]:
+    input_path, start, end, record_filter, json_backend = task
+    with input_path.open("rb") as handle:
+        handle.seek(start)
+        lines = handle.read(end - start).split(b"\n")
+    if lines and not lines[-1]:
+        lines.pop()
+    return len(lines), parse_comment_lines(lines, record_filter, json_backend)
+
+
+def _parse_line_batch(
+    task: Tuple[List[bytes], Optional[RecordFilter], str],
+) -> Tuple[int, CommentStore]:
+    lines, record_filter, json_backend = task
+    return len(lines), parse_comment_lines(lines, record_filter, json_backend)
+
+
+def _iter_line_batches(
+    input_path: Path,
+    line_offset: int = 0,
+    byte_offset: int = 0,
+) -> Iterator[List[bytes]]:
+    batch: List[bytes] = []
+    for line in iter_lines_from(input_path, line_offset, byte_offset):
+        batch.append(line)
+        if len(batch) >= LINES_PER_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_comment_chunks(
+    input_path: Path,
+    record_filter: Optional[RecordFilter],
+    workers: int,
+    json_backend: str,
+    line_offset: int = 0,
+    byte_offset: int = 0,
+) -> Iterator[Tuple[int, int, CommentStore]]:
+    """
+    Parse ``input_path`` from the given position in file-order chunks,
+    yielding ``(lines, bytes, store)`` per chunk. The byte counts are only
+    meaningful for plain inputs, which is the only case they are used for.
+    """
+    if workers <= 1:
+        for batch in _iter_line_batches(input_path, line_offset, byte_offset):
+            yield (
+                len(batch),
+                sum(len(line) for line in batch),
+                parse_comment_lines(batch, record_filter, json_backend),
+            )
+        return
+
+    if is_compressed(input_path):
+        batches = _iter_line_batches(input_path, line_offset)
+        tasks: Iterable = ((batch, record_filter, json_backend) for batch in batches)
+        for line_count, chunk in ordered_imap(_parse_line_batch, tasks, workers=workers):
+            yield line_count, 0, chunk
+        return
+
+    ranges = list(iter_byte_ranges(input_path, workers * CHUNKS_PER_WORKER, byte_offset))
+    tasks = (
+        (input_path, start, end, record_filter, json_backend) for start, end in ranges
+    )
+    results = ordered_imap(_parse_byte_range, tasks, workers=workers)
+    for (start, end), (line_count, chunk) in zip(ranges, results):
+        yield line_count, end - start, chunk
+
+
+def _read_comments_parallel(
+    input_path: Path,
+    report_every: int,
+    record_filter: Optional[RecordFilter],
+    workers: int,
+    json_backend: str,
+) -> CommentStore:
+    # Chunks come back in file order, so concatenating them reproduces the
+    # serial store exactly (including which duplicate id wins).
+    chunks: List[CommentStore] = []
+    lines_read = 0
+    for line_count, _, chunk in iter_comment_chunks(
+        input_path, record_filter, workers, json_backend
+    ):
+        chunks.append(chunk)
+        previous = lines_read
+        lines_read += line_count
+        if lines_read // report_every > previous // report_every:
+            print(f"Read {lines_read:,} comments...", flush=True)
+
+    if not chunks:
+        return CommentStoreBuilder().build()
+    return CommentStore.concat(chunks)
+
+
+@dataclass
+class ChildIndex:
+    """
+    CSR-style reply index: the replies of ``row`` are
+    ``child_rows[offsets[row]:offsets[row + 1]]``, already in
+    (created_utc, id) order. ``parent_rows`` is -1 for comments whose parent
+    is the submission or was not loaded.
+    """
+
+    parent_rows: np.ndarray
+    offsets: np.ndarray
+    child_rows: np.ndarray
+
+    def children(self, row: int) -> List[int]:
+        return self.child_rows[self.offsets[row] : self.offsets[row + 1]].tolist()
+
+    @classmethod
+    def from_ordered_replies(
+        cls,
+        parent_rows: np.ndarray,
+        child_rows: np.ndarray,
+    ) -> "ChildIndex":
+        """Index built from every reply row, already sorted by (parent, sibling order)."""
+        counts = np.bincount(parent_rows[child_rows], minlength=len(parent_rows))
+        offsets = np.zeros(len(parent_rows) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(parent_rows=parent_rows, offsets=offsets, child_rows=child_rows)
+
+
+def attach_children(store: CommentStore) -> ChildIndex:
+    """Order every reply of the month with one lexsort on (parent, created_utc, id)."""
+    parent_rows = store.rows_for_ids(store.parent_ids)
+    replies = np.flatnonzero(parent_rows >= 0)
+    order = np.lexsort(
+        (store.ids[replies], store.created_utc[replies], parent_rows[replies])
+    )
+    return ChildIndex.from_ordered_replies(parent_rows, replies[order])
+
+
+@dataclass
+class SubmissionIndex:
+    """
+    Comments grouped by submission, with the per-submission stats that
+    ordering, ``--min-comments`` filtering and the thread payload need
+    computed once. Entry ``i`` (in chronological order) owns
+    ``rows[starts[i]:ends[i]]``.
+    """
+
+    link_ids: np.ndarray
+    comment_counts: np.ndarray
+    created_min: np.ndarray
+    created_max: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    rows: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.link_ids)
+
+    def comment_rows(self, idx: int) -> np.ndarray:
+        return self.rows[self.starts[idx] : self.ends[idx]]
 
 
-def iter_submissions_in_chron_order(
-    submissions: defaultdict[str, List[str]],
-    lookup: Dict[str, CommentNode],
-) -> Iterable[str]:
-    def submission_sort_key(link_id: str):
-        ids = submissions[link_id]
-        timestamps = [lookup[cid].created_utc for cid in ids]
-        return (min(timestamps), link_id)
+def group_by_submission(store: CommentStore) -> SubmissionIndex:
+    """Group rows by link_id and order submissions by (first comment time, link_id)."""
+    rows = np.argsort(store.link_ids, kind="stable")
+    sorted_links = store.link_ids[rows]
+    starts = np.flatnonzero(np.diff(sorted_links, prepend=-1) != 0) if len(rows) else rows
+    ends = np.append(starts[1:], len(rows)).astype(np.int64)
+    link_ids = sorted_links[starts]
+    if len(rows):
+        created_sorted = store.created_utc[rows]
+        created_min = np.minimum.reduceat(created_sorted, starts)
+        created_max = np.maximum.reduceat(created_sorted, starts)
+    else:
+        created_min = created_max = np.empty(0, dtype=np.int64)
 
-    return sorted(submissions.keys(), key=submission_sort_key)
+    chron = np.lexsort((link_ids, created_min))
+    return SubmissionIndex(
+        link_ids=link_ids[chron],
+        comment_counts=(ends - starts)[chron],
+        created_min=created_min[chron],
+        created_max=created_max[chron],
+        starts=starts[chron],
+        ends=ends[chron],
+        rows=rows,
+    )
+
+
+def comment_payload(row: int, store: CommentStore, body: Optional[str]) -> Dict:
+    """
+    Output node for ``row``; ``body`` is passed in because callers decode it
+    first. ``id`` and ``parent_id`` are left as None for the caller to fill
+    in with one :func:`decode_ids` call per thread.
+    """
+    return {
+        "id": None,
+        "parent_id": None,
+        "author": store.author.get(row),
+        "body": body,
+        "body_cleaned": store.body_cleaned.get(row),
+        "net_votes": int(store.score[row]),
+        "controversiality": int(store.controversiality[row]),
+        "created_utc": int(store.created_utc[row]),
+        "distinguished": store.distinguished.get(row),
+        "edited": store.edited.get(row),
+        "children": [],
+    }
 
 
 def is_deleted_body(body: Optional[str]) -> bool:
@@ -182,106 +725,940 @@ def is_deleted_body(body: Optional[str]) -> bool:
     return stripped.lower() in DELETED_BODIES
 
 
-def prune_deleted_nodes(nodes: List[Dict]) -> List[Dict]:
-    pruned: List[Dict] = []
-    for node in nodes:
-        pruned.extend(_prune_node(node))
-    return pruned
+def build_pruned_trees(
+    roots: List[int],
+    store: CommentStore,
+    children: ChildIndex,
+) -> Tuple[List[Dict], int, int]:
+    """
+    Build the nested trees below ``roots`` with deleted comments already
+    spliced out, in one explicit-stack traversal.
 
+    Deleted comments are detected before they are materialized: their
+    replies are scheduled directly into the deleted comment's slot, so they
+    slide up exactly as a separate pruning pass would move them. Returns the
+    trees, the number of surviving comments and the row of the first
+    surviving root (-1 if nothing survived).
+    """
+    trees: List[Dict] = []
+    nodes: List[Dict] = []
+    node_rows: List[int] = []
+    first_root_row = -1
+    stack: List[Tuple[int, List[Dict]]] = [(row, trees) for row in reversed(roots)]
+    while stack:
+        row, target = stack.pop()
+        replies = children.children(row)
+        body = store.body.get(row)
+        if is_deleted_body(body):
+            stack.extend((child_row, target) for child_row in reversed(replies))
+            continue
 
-def _prune_node(node: Dict) -> List[Dict]:
-    node["children"] = prune_deleted_nodes(node.get("children", []))
-    if is_deleted_body(node.get("body")):
-        return node["children"]
-    return [node]
+        node = comment_payload(row, store, body)
+        if target is trees and not trees:
+            first_root_row = row
+        target.append(node)
+        nodes.append(node)
+        node_rows.append(row)
+        stack.extend((child_row, node["children"]) for child_row in reversed(replies))
 
+    rows = np.asarray(node_rows, dtype=np.int64)
+    decoded = decode_ids(np.concatenate((store.ids[rows], store.parent_ids[rows])))
+    for node, comment_id, parent_id in zip(nodes, decoded, decoded[len(nodes) :]):
+        node["id"] = comment_id
+        node["parent_id"] = parent_id
+    return trees, len(nodes), first_root_row
 
-def count_comments(nodes: List[Dict]) -> int:
-    total = 0
-    for node in nodes:
-        total += 1 + count_comments(node.get("children", []))
-    return total
 
+@dataclass
+class ThreadPlan:
+    """Everything about a submission's thread that is known before its trees are built."""
 
-def reconstruct_threads(
-    lookup: Dict[str, CommentNode],
-    max_threads: Optional[int],
+    link_id: int
+    created_utc_min: int
+    created_utc_max: int
+    orphan_comments: int
+    roots: List[int]
+
+
+def plan_threads(
+    store: CommentStore,
+    children: ChildIndex,
     min_comments: int,
-) -> List[Dict]:
-    submissions = group_by_submission(lookup)
-    ordered_links = iter_submissions_in_chron_order(submissions, lookup)
-
-    results: List[Dict] = []
-    for link_id in ordered_links:
-        comment_ids = submissions[link_id]
-        if len(comment_ids) < min_comments:
-            continue
+) -> Iterator[ThreadPlan]:
+    """Yield a plan per eligible submission, in chronological order."""
+    submissions = group_by_submission(store)
+    parent_rows = children.parent_rows
+    eligible = np.flatnonzero(submissions.comment_counts >= min_comments)
 
-        roots: List[str] = []
-        orphaned = 0
-        for comment_id in comment_ids:
-            parent_id = lookup[comment_id].parent_id
-            if parent_id == link_id or parent_id not in lookup:
-                if parent_id not in lookup and not parent_id.startswith("t3_"):
-                    orphaned += 1
-                roots.append(comment_id)
-
-        roots = sorted(
-            roots,
-            key=lambda cid: (lookup[cid].created_utc, lookup[cid].id),
+    for idx in eligible.tolist():
+        link_code = int(submissions.link_ids[idx])
+        rows = submissions.comment_rows(idx)
+        parent_codes = store.parent_ids[rows]
+        missing_parent = parent_rows[rows] < 0
+        is_root = (parent_codes == link_code) | missing_parent
+        orphaned = int(
+            np.count_nonzero(missing_parent & (id_type(parent_codes) != SUBMISSION))
         )
 
+        root_rows = rows[is_root]
+        order = np.lexsort((store.ids[root_rows], store.created_utc[root_rows]))
+        roots = root_rows[order].tolist()
+
         if not roots:
             continue
 
-        created_times = [lookup[cid].created_utc for cid in comment_ids]
-        root_trees = prune_deleted_nodes(
-            [build_tree(root_id, lookup) for root_id in roots]
+        yield ThreadPlan(
+            link_id=link_code,
+            created_utc_min=int(submissions.created_min[idx]),
+            created_utc_max=int(submissions.created_max[idx]),
+            orphan_comments=orphaned,
+            roots=roots,
         )
-        if not root_trees:
+
+
+def assemble_thread(
+    plan: ThreadPlan,
+    store: CommentStore,
+    children: ChildIndex,
+) -> Optional[Dict]:
+    """Thread payload for ``plan``, or None if every comment was deleted."""
+    root_trees, comment_count, first_root_row = build_pruned_trees(
+        plan.roots, store, children
+    )
+    if not root_trees:
+        return None
+
+    return {
+        "link_id": decode_id(plan.link_id),
+        "subreddit": store.subreddit.get(first_root_row),
+        "comment_count": comment_count,
+        "root_count": len(root_trees),
+        "created_utc_min": plan.created_utc_min,
+        "created_utc_max": plan.created_utc_max,
+        "orphan_comments": plan.orphan_comments,
+        "roots": root_trees,
+    }
+
+
+def reconstruct_threads(
+    store: CommentStore,
+    children: ChildIndex,
+    max_threads: Optional[int],
+    min_comments: int,
+) -> Iterator[Dict]:
+    """
+    Yield one thread payload per submission in chronological order.
+
+    Threads are produced lazily so the writer can serialize and drop each
+    nested tree before the next one is built; only the compact store stays
+    resident for the whole run.
+    """
+    emitted = 0
+    for plan in plan_threads(store, children, min_comments):
+        thread_payload = assemble_thread(plan, store, children)
+        if thread_payload is None:
             continue
 
-        thread_payload = {
-            "link_id": link_id,
-            "subreddit": lookup[root_trees[0]["id"]].subreddit,
-            "comment_count": count_comments(root_trees),
-            "root_count": len(root_trees),
-            "created_utc_min": min(created_times),
-            "created_utc_max": max(created_times),
-            "orphan_comments": orphaned,
-            "roots": root_trees,
-        }
-        results.append(thread_payload)
-
-        if max_threads and len(results) >= max_threads:
+        yield thread_payload
+        del thread_payload
+        emitted += 1
+
+        if max_threads and emitted >= max_threads:
             break
 
-    return results
 
+@dataclass
+class ThreadBatch:
+    """
+    Consecutive threads packed for a worker process: a compact store holding
+    just their comments (in pre-order), a reply index over it, and plans
+    whose roots are rows of that store.
+    """
+
+    store: CommentStore
+    children: ChildIndex
+    plans: List[ThreadPlan]
+    encode: Optional[ThreadEncoder] = None
+
+
+def collect_tree_rows(roots: List[int], children: ChildIndex) -> Tuple[List[int], List[int]]:
+    """Pre-order rows of the trees below ``roots`` and the positions of the roots."""
+    rows: List[int] = []
+    root_positions: List[int] = []
+    for root in roots:
+        root_positions.append(len(rows))
+        stack = [root]
+        while stack:
+            row = stack.pop()
+            rows.append(row)
+            stack.extend(reversed(children.children(row)))
+    return rows, root_positions
+
+
+def _pack_batch(
+    store: CommentStore,
+    children: ChildIndex,
+    rows: List[int],
+    plans: List[ThreadPlan],
+    encode: Optional[ThreadEncoder],
+) -> ThreadBatch:
+    batch_rows = np.asarray(rows, dtype=np.int64)
+    # Re-express parents as positions within the batch. Every non-root row's
+    # parent is in the batch, since whole subtrees are packed.
+    order = np.argsort(batch_rows)
+    parents = children.parent_rows[batch_rows]
+    positions = np.searchsorted(batch_rows[order], np.maximum(parents, 0))
+    positions[positions == len(batch_rows)] = 0
+    local_parents = np.where(parents >= 0, order[positions], -1)
+    # Pre-order keeps siblings in order, so a stable sort by parent suffices.
+    replies = np.flatnonzero(local_parents >= 0)
+    child_rows = replies[np.argsort(local_parents[replies], kind="stable")]
+    return ThreadBatch(
+        store=store.compact(batch_rows),
+        children=ChildIndex.from_ordered_replies(local_parents, child_rows),
+        plans=plans,
+        encode=encode,
+    )
+
+
+def iter_thread_batches(
+    plans: Iterable[ThreadPlan],
+    store: CommentStore,
+    children: ChildIndex,
+    encode: Optional[ThreadEncoder] = None,
+    batch_comments: int = THREAD_BATCH_COMMENTS,
+) -> Iterator[ThreadBatch]:
+    rows: List[int] = []
+    batch_plans: List[ThreadPlan] = []
+    for plan in plans:
+        tree_rows, root_positions = collect_tree_rows(plan.roots, children)
+        offset = len(rows)
+        rows.extend(tree_rows)
+        plan.roots = [offset + position for position in root_positions]
+        batch_plans.append(plan)
+        if len(rows) >= batch_comments:
+            yield _pack_batch(store, children, rows, batch_plans, encode)
+            rows, batch_plans = [], []
+    if batch_plans:
+        yield _pack_batch(store, children, rows, batch_plans, encode)
+
+
+def _assemble_batch(batch: ThreadBatch) -> List[object]:
+    lines: List[object] = []
+    for plan in batch.plans:
+        thread = assemble_thread(plan, batch.store, batch.children)
+        encode = batch.encode or encode_thread
+        lines.append(None if thread is None else encode(thread))
+    return lines
+
+
+def assemble_thread_lines(
+    store: CommentStore,
+    children: ChildIndex,
+    min_comments: int,
+    workers: int = 1,
+    skip_plans: int = 0,
+    encode: Optional[ThreadEncoder] = None,
+) -> Iterator[object]:
+    """
+    One serialized thread per planned submission (None where every comment
+    was deleted), in chronological order, after skipping the first
+    ``skip_plans`` plans. Threads are serialized with ``encode`` (default:
+    :func:`encode_thread`). With ``workers > 1`` tree assembly and encoding
+    run in a process pool: batches of threads are shipped as compact
+    arrays and their records come back in order.
+    """
+    encode = encode or encode_thread
+    plans = islice(plan_threads(store, children, min_comments), skip_plans, None)
+    if workers <= 1:
+        for plan in plans:
+            thread = assemble_thread(plan, store, children)
+            yield None if thread is None else encode(thread)
+        return
+
+    batches = iter_thread_batches(plans, store, children, encode)
+    for lines in ordered_imap(_assemble_batch, batches, workers=workers):
+        yield from lines
+
+
+def reconstruct_thread_lines(
+    store: CommentStore,
+    children: ChildIndex,
+    max_threads: Optional[int],
+    min_comments: int,
+    workers: int = 1,
+    encode: Optional[ThreadEncoder] = None,
+) -> Iterator[object]:
+    """Serialized threads in chronological order (see :func:`assemble_thread_lines`)."""
+    emitted = 0
+    for line in assemble_thread_lines(
+        store, children, min_comments, workers, encode=encode
+    ):
+        if line is None:
+            continue
+        yield line
+        emitted += 1
+        if max_threads and emitted >= max_threads:
+            return
+
+
+def encode_thread(thread: Dict) -> str:
+    """
+    Serialize a thread exactly like ``json.dumps``. The C encoder recurses
+    once per nesting level, so threads too deep for it are emitted with an
+    explicit stack instead (every node keeps ``children`` as its last key).
+    """
+    try:
+        return json.dumps(thread)
+    except RecursionError:
+        pass
+
+    def open_node(node: Dict, key: str) -> str:
+        fields = {name: value for name, value in node.items() if name != key}
+        return json.dumps(fields)[:-1] + f', "{key}": ['
+
+    parts = [open_node(thread, "roots")]
+    stack: List[object] = ["]}"]
+    stack.extend(_interleave_reversed(thread["roots"]))
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+            continue
+        parts.append(open_node(item, "children"))  # type: ignore[arg-type]
+        stack.append("]}")
+        stack.extend(_interleave_reversed(item["children"]))  # type: ignore[index]
+    return "".join(parts)
+
+
+def _interleave_reversed(nodes: List[Dict]) -> List[object]:
+    """Nodes separated by ", ", reversed for pushing onto a stack."""
+    items: List[object] = []
+    for idx in range(len(nodes) - 1, -1, -1):
+        items.append(nodes[idx])
+        if idx:
+            items.append(", ")
+    return items
+
+
+def thread_encoder(output_path: Path, comment_rows: bool = False) -> ThreadEncoder:
+    """
+    How to serialize threads for ``output_path``: JSON lines or flattened
+    threads. With ``comment_rows`` JSON lines come paired with the flattened
+    thread, so the Parquet export does not have to parse them back.
+    """
+    if is_thread_store(output_path):
+        return flatten_thread
+    return encode_and_flatten if comment_rows else encode_thread
+
+
+def encode_and_flatten(thread: Dict) -> Tuple[str, FlatThread]:
+    return encode_thread(thread), flatten_thread(thread)
+
+
+def export_comment_rows(records: Iterable[object], output_dir: Path) -> Iterator[object]:
+    """
+    Pass serialized threads through to the writer, adding every comment of
+    each to the per-comment Parquet export in ``output_dir``.
+    """
+    table = CommentTableWriter(output_dir)
+    for record in records:
+        if isinstance(record, tuple):
+            record, flat = record
+        elif isinstance(record, FlatThread):
+            flat = record
+        else:
+            flat = flatten_thread(decode_thread(record))
+        table.add(flat)
+        yield record
+    table.close()
 
-def write_threads(threads: Iterable[Dict], output_path: Path) -> None:
+
+def write_thread_records(records: Iterable[object], output_path: Path) -> None:
+    """Write threads serialized with :func:`thread_encoder` for ``output_path``."""
+    if not is_thread_store(output_path):
+        write_thread_lines(records, output_path)  # type: ignore[arg-type]
+        return
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    written = write_thread_store(records, output_path)  # type: ignore[arg-type]
+    print(f"Wrote {written:,} threads to {output_path}", flush=True)
+
+
+def records_from_lines(lines: Iterable[str], output_path: Path) -> Iterable[object]:
+    """Re-encode JSON thread lines (e.g. from partition files) for ``output_path``."""
+    if not is_thread_store(output_path):
+        return lines
+    return (flatten_thread(decode_thread(line)) for line in lines)
+
+
+def write_thread_lines(lines: Iterable[str], output_path: Path) -> None:
+    """Write already-serialized thread records, one per line."""
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as handle:
-        for thread in threads:
-            handle.write(json.dumps(thread))
+    written = 0
+    with open_text(output_path, "w") as handle:
+        for line in lines:
+            handle.write(line)
             handle.write("\n")
-    print(f"Wrote {output_path}", flush=True)
+            written += 1
+    print(f"Wrote {written:,} threads to {output_path}", flush=True)
 
 
-def main() -> None:
-    args = parse_args()
-    comments = read_comments(
-        args.input_path,
-        report_every=args.report_every,
-        subreddit_filter=args.subreddit,
+def read_comments_checkpointed(
+    input_path: Path,
+    checkpoint: RunCheckpoint,
+    interval: float,
+    report_every: int,
+    record_filter: Optional[RecordFilter] = None,
+    workers: int = 1,
+    json_backend: str = "auto",
+) -> CommentStore:
+    """
+    :func:`read_comments` that saves the comments parsed so far as a new
+    checkpoint segment every ``interval`` seconds, and picks up after the
+    last segment of a resumed checkpoint.
+    """
+    segments = checkpoint.load_segments()
+    if not checkpoint.ingest_done:
+        if checkpoint.segments:
+            print(
+                f"Resuming after {checkpoint.lines:,} lines "
+                f"({checkpoint.segments} checkpoint segments)...",
+                flush=True,
+            )
+        lines_read, bytes_read = checkpoint.lines, checkpoint.byte_offset
+        pending: List[CommentStore] = []
+        last_saved = time.monotonic()
+        for line_count, byte_count, chunk in iter_comment_chunks(
+            input_path,
+            record_filter,
+            workers,
+            json_backend,
+            line_offset=lines_read,
+            byte_offset=bytes_read,
+        ):
+            pending.append(chunk)
+            previous = lines_read
+            lines_read += line_count
+            bytes_read += byte_count
+            if lines_read // report_every > previous // report_every:
+                print(f"Read {lines_read:,} comments...", flush=True)
+            if time.monotonic() - last_saved >= interval:
+                segments.append(CommentStore.concat(pending))
+                checkpoint.add_segment(segments[-1], lines_read, bytes_read)
+                pending = []
+                last_saved = time.monotonic()
+                print(f"Checkpointed after {lines_read:,} lines.", flush=True)
+        if pending:
+            segments.append(CommentStore.concat(pending))
+            checkpoint.add_segment(segments[-1], lines_read, bytes_read)
+        checkpoint.ingest_done = True
+        checkpoint.save()
+
+    store = CommentStore.concat(segments) if segments else CommentStoreBuilder().build()
+    store = store.drop_duplicate_ids()
+    print(f"Loaded {len(store):,} comments into memory.", flush=True)
+    return store
+
+
+def write_thread_lines_checkpointed(
+    records: Iterable[Optional[str]],
+    output_path: Path,
+    checkpoint: RunCheckpoint,
+    interval: float,
+    max_threads: Optional[int],
+) -> None:
+    """
+    Write the output of :func:`assemble_thread_lines` (which must skip the
+    ``checkpoint.plans_done`` plans already handled), recording progress
+    every ``interval`` seconds. A resumed run first truncates the output to
+    its last checkpointed length, dropping any partially written records.
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    plans_done = checkpoint.plans_done
+    written = checkpoint.threads_written
+    if plans_done and not output_path.exists():
+        raise FileNotFoundError(
+            f"Checkpoint expects a partial output at {output_path}; "
+            "rerun without --resume to start over."
+        )
+    with output_path.open("r+b" if plans_done else "wb") as handle:
+        handle.truncate(checkpoint.output_bytes)
+        handle.seek(checkpoint.output_bytes)
+        last_saved = time.monotonic()
+        for line in records:
+            if max_threads and written >= max_threads:
+                break
+            plans_done += 1
+            if line is not None:
+                # Records are ASCII: json.dumps escapes everything else.
+                handle.write(line.encode("ascii"))
+                handle.write(b"\n")
+                written += 1
+            if time.monotonic() - last_saved >= interval:
+                handle.flush()
+                os.fsync(handle.fileno())
+                checkpoint.record_output(plans_done, written, handle.tell())
+                last_saved = time.monotonic()
+    print(f"Wrote {written:,} threads to {output_path}", flush=True)
+
+
+def reconstruct_with_checkpoints(
+    input_path: Path,
+    output_path: Path,
+    *,
+    checkpoint_dir: Path,
+    resume: bool,
+    interval: float,
+    report_every: int,
+    subreddits: Optional[FrozenSet[str]],
+    workers: int,
+    max_threads: Optional[int],
+    min_comments: int,
+    json_backend: str = "auto",
+) -> None:
+    """
+    In-memory reconstruction of one dump that checkpoints both phases, so
+    an interrupted run can continue with ``resume``. The checkpoint is
+    removed once the output is complete.
+    """
+    stat = input_path.stat()
+    settings = {
+        "input_path": str(input_path.resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "subreddits": sorted(subreddits) if subreddits else None,
+        "min_comments": min_comments,
+        "max_threads": max_threads,
+    }
+    checkpoint = RunCheckpoint.open(checkpoint_dir, settings, resume)
+    store = read_comments_checkpointed(
+        input_path,
+        checkpoint,
+        interval,
+        report_every=report_every,
+        record_filter=RecordFilter(subreddits=subreddits),
+        workers=workers,
+        json_backend=json_backend,
     )
-    attach_children(comments)
-    threads = reconstruct_threads(
-        comments,
-        max_threads=args.max_threads,
-        min_comments=args.min_comments,
+    children = attach_children(store)
+    if checkpoint.plans_done:
+        print(
+            f"Resuming output after {checkpoint.threads_written:,} threads.", flush=True
+        )
+    records = assemble_thread_lines(
+        store,
+        children,
+        min_comments,
+        workers=workers,
+        skip_plans=checkpoint.plans_done,
     )
-    write_threads(threads, args.output_path)
+    write_thread_lines_checkpointed(records, output_path, checkpoint, interval, max_threads)
+    checkpoint.remove()
+
+
+def scan_link_id(line: bytes) -> bytes:
+    """Raw link_id of a non-blank line, decoding JSON only as a fallback."""
+    match = _LINK_ID_FIELD.search(line)
+    if match:
+        return match.group(1)
+    return json.loads(line)["link_id"].encode()
+
+
+def partition_comments(
+    input_paths: Sequence[Path],
+    spill_dir: Path,
+    partitions: int,
+    report_every: int,
+    subreddits: Optional[FrozenSet[str]] = None,
+    append: bool = False,
+    touched: Optional[List[Set[int]]] = None,
+) -> List[Path]:
+    """
+    Stream every input once and append each raw line to one of
+    ``partitions`` bucket files chosen by a stable hash of its link_id, so
+    all comments of a submission end up in the same bucket regardless of
+    which monthly dump they came from.
+
+    With ``append`` existing bucket files are extended rather than
+    replaced. If ``touched`` is given (one set per bucket), the encoded
+    link_id of every partitioned comment is added to its bucket's set.
+    """
+    line_filter = RecordFilter(subreddits=subreddits)
+    paths = [spill_dir / f"comments-{idx:04d}.jsonl" for idx in range(partitions)]
+    handles = [path.open("ab" if append else "wb") for path in paths]
+    try:
+        lines_read = 0
+        for input_path in input_paths:
+            print(f"Partitioning {input_path}...", flush=True)
+            for line in iter_lines(input_path):
+                lines_read += 1
+                if not line.strip() or not line_filter.accepts_line(line):
+                    continue
+                link_id = scan_link_id(line)
+                bucket = zlib.crc32(link_id) % partitions
+                handles[bucket].write(line if line.endswith(b"\n") else line + b"\n")
+                if touched is not None:
+                    touched[bucket].add(encode_id(link_id.decode()))
+                if lines_read % report_every == 0:
+                    print(f"Partitioned {lines_read:,} comments...", flush=True)
+    finally:
+        for handle in handles:
+            handle.close()
+    return paths
+
+
+def _reconstruct_partition_task(task: Tuple[Path, Path, Dict]) -> Path:
+    comments_path, threads_path, options = task
+    threads_path = reconstruct_partition(comments_path, threads_path, **options)
+    comments_path.unlink()
+    return threads_path
+
+
+def reconstruct_partition(
+    comments_path: Path,
+    threads_path: Path,
+    *,
+    subreddits: Optional[FrozenSet[str]],
+    min_comments: int,
+    report_every: int,
+    workers: int = 1,
+    json_backend: str = "auto",
+    link_ids: Optional[Set[int]] = None,
+) -> Path:
+    """
+    Reconstruct one bucket (or only the submissions in ``link_ids``) and
+    store its threads, in chronological order, as
+    ``created_utc_min<TAB>link_code<TAB>thread JSON`` lines for merging.
+    """
+    store = read_comments(
+        comments_path,
+        report_every=report_every,
+        record_filter=RecordFilter(subreddits=subreddits, link_ids=link_ids),
+        workers=workers,
+        json_backend=json_backend,
+    )
+    children = attach_children(store)
+    with threads_path.open("w", encoding="utf-8") as handle:
+        for thread in reconstruct_threads(
+            store,
+            children,
+            max_threads=None,
+            min_comments=min_comments,
+        ):
+            handle.write(
+                f"{thread['created_utc_min']}\t{encode_id(thread['link_id'])}\t"
+                f"{encode_thread(thread)}\n"
+            )
+    return threads_path
+
+
+def _iter_keyed_threads(path: Path) -> Iterator[Tuple[int, int, str]]:
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            created_min, link_code, payload = line.rstrip("\n").split("\t", 2)
+            yield int(created_min), int(link_code), payload
+
+
+def merge_partition_threads(
+    thread_paths: Sequence[Path],
+    max_threads: Optional[int] = None,
+) -> Iterator[str]:
+    """Merge per-bucket thread files back into global (created_utc_min, link_id) order."""
+    merged = heapq.merge(*(_iter_keyed_threads(path) for path in thread_paths))
+    for emitted, (_, _, payload) in enumerate(merged, start=1):
+        yield payload
+        if max_threads and emitted >= max_threads:
+            break
+
+
+def partition_options(
+    *,
+    subreddits: Optional[FrozenSet[str]],
+    min_comments: int,
+    report_every: int,
+    workers: int,
+    partition_workers: int,
+    json_backend: str,
+) -> Dict:
+    """Keyword arguments for :func:`reconstruct_partition`, shared by every bucket."""
+    return {
+        "subreddits": subreddits,
+        "min_comments": min_comments,
+        "report_every": report_every,
+        # Partition workers parse serially; nested pools would oversubscribe.
+        "workers": workers if partition_workers <= 1 else 1,
+        "json_backend": json_backend,
+    }
+
+
+def run_partition_tasks(
+    task_fn: Callable[[Tuple], Path],
+    tasks: Sequence[Tuple],
+    partition_workers: int,
+) -> List[Path]:
+    """Run per-bucket tasks, ``partition_workers`` at a time, returning results in order."""
+    if partition_workers > 1:
+        return list(ordered_imap(task_fn, tasks, workers=partition_workers))
+    results = []
+    for idx, task in enumerate(tasks, start=1):
+        print(f"Reconstructing partition {idx}/{len(tasks)}...", flush=True)
+        results.append(task_fn(task))
+    return results
+
+
+def reconstruct_partitioned(
+    input_paths: Sequence[Path],
+    output_path: Path,
+    *,
+    partitions: int,
+    subreddits: Optional[FrozenSet[str]],
+    min_comments: int,
+    max_threads: Optional[int],
+    report_every: int,
+    workers: int = 1,
+    partition_workers: int = 1,
+    spill_dir: Optional[Path] = None,
+    json_backend: str = "auto",
+) -> Iterator[str]:
+    """
+    Out-of-core reconstruction of one or more dumps (e.g. a month larger
+    than RAM, or a year of months): shard comments by link_id into on-disk
+    buckets, rebuild each bucket on its own (``partition_workers`` at a
+    time), then merge. Yields serialized thread records in the usual
+    chronological order.
+    """
+    spill_root = spill_dir or output_path.parent
+    spill_root.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(
+        prefix=f".{output_path.name}.partitions-", dir=spill_root
+    ) as spill:
+        work_dir = Path(spill)
+        comment_paths = partition_comments(
+            input_paths,
+            work_dir,
+            partitions,
+            report_every=report_every,
+            subreddits=subreddits,
+        )
+        options = partition_options(
+            subreddits=subreddits,
+            min_comments=min_comments,
+            report_every=report_every,
+            workers=workers,
+            partition_workers=partition_workers,
+            json_backend=json_backend,
+        )
+        tasks = [
+            (comments_path, work_dir / f"threads-{idx:04d}.tsv", options)
+            for idx, comments_path in enumerate(comment_paths)
+        ]
+        thread_paths = run_partition_tasks(
+            _reconstruct_partition_task, tasks, partition_workers
+        )
+        yield from merge_partition_threads(thread_paths, max_threads)
+
+
+def update_partition(
+    comments_path: Path,
+    threads_path: Path,
+    link_ids: Optional[Set[int]],
+    options: Dict,
+) -> Path:
+    """
+    Rebuild the threads of ``link_ids`` (all of them if None) in a
+    persistent bucket and splice them into its thread file, keeping every
+    other record as it is.
+    """
+    if link_ids is None or not threads_path.exists():
+        return reconstruct_partition(comments_path, threads_path, **options)
+
+    rebuilt_path = threads_path.with_name(threads_path.name + ".rebuilt")
+    merged_path = threads_path.with_name(threads_path.name + ".tmp")
+    reconstruct_partition(comments_path, rebuilt_path, link_ids=link_ids, **options)
+    kept = (
+        keyed
+        for keyed in _iter_keyed_threads(threads_path)
+        if keyed[1] not in link_ids
+    )
+    with merged_path.open("w", encoding="utf-8") as handle:
+        for created_min, link_code, payload in heapq.merge(
+            kept, _iter_keyed_threads(rebuilt_path)
+        ):
+            handle.write(f"{created_min}\t{link_code}\t{payload}\n")
+    rebuilt_path.unlink()
+    os.replace(merged_path, threads_path)
+    return threads_path
+
+
+def _update_partition_task(task: Tuple[Path, Path, Optional[Set[int]], Dict]) -> Path:
+    return update_partition(*task)
+
+
+def reconstruct_incremental(
+    input_paths: Sequence[Path],
+    state_dir: Path,
+    *,
+    partitions: Optional[int],
+    subreddits: Optional[FrozenSet[str]],
+    min_comments: int,
+    max_threads: Optional[int],
+    report_every: int,
+    workers: int = 1,
+    partition_workers: int = 1,
+    json_backend: str = "auto",
+) -> Iterator[str]:
+    """
+    Partitioned reconstruction that keeps its buckets in ``state_dir``.
+    Dumps already listed in the manifest are skipped; comments of new dumps
+    are appended to the buckets, and only the submissions they touch are
+    rebuilt. Yields the threads of every dump processed so far.
+    """
+    state_dir.mkdir(parents=True, exist_ok=True)
+    settings = {
+        "subreddits": sorted(subreddits) if subreddits else None,
+        "min_comments": min_comments,
+    }
+    manifest = StateManifest.load(state_dir)
+    if manifest is None:
+        manifest = StateManifest(
+            settings={**settings, "partitions": partitions or DEFAULT_PARTITIONS}
+        )
+    elif partitions:
+        manifest.check_settings({**settings, "partitions": partitions})
+    else:
+        manifest.check_settings(settings)
+    partitions = manifest.settings["partitions"]
+    fresh = not manifest.inputs
+
+    new_inputs = manifest.find_new_inputs(list(input_paths))
+    thread_paths = [state_dir / f"threads-{idx:04d}.tsv" for idx in range(partitions)]
+    if new_inputs:
+        touched: List[Set[int]] = [set() for _ in range(partitions)]
+        comment_paths = partition_comments(
+            new_inputs,
+            state_dir,
+            partitions,
+            report_every=report_every,
+            subreddits=subreddits,
+            append=True,
+            touched=touched,
+        )
+        options = partition_options(
+            subreddits=subreddits,
+            min_comments=min_comments,
+            report_every=report_every,
+            workers=workers,
+            partition_workers=partition_workers,
+            json_backend=json_backend,
+        )
+        tasks = [
+            (comment_paths[idx], thread_paths[idx], None if fresh else touched[idx], options)
+            for idx in range(partitions)
+            if touched[idx] or not thread_paths[idx].exists()
+        ]
+        print(
+            f"Updating {sum(len(links) for links in touched):,} submissions "
+            f"in {len(tasks)}/{partitions} partitions...",
+            flush=True,
+        )
+        run_partition_tasks(_update_partition_task, tasks, partition_workers)
+    else:
+        print(f"No new inputs; state in {state_dir} is up to date.", flush=True)
+
+    # Saved last: if a run is interrupted, the next one re-appends the same
+    # dumps, which is harmless since duplicate comment ids are dropped.
+    manifest.save(state_dir)
+    yield from merge_partition_threads(
+        [path for path in thread_paths if path.exists()], max_threads
+    )
+
+
+def main() -> None:
+    args = parse_args()
+    input_path = args.input_paths[0]
+    if args.resume or args.checkpoint_interval is not None:
+        reconstruct_with_checkpoints(
+            input_path,
+            args.output_path,
+            checkpoint_dir=args.checkpoint_dir
+            or args.output_path.with_name(args.output_path.name + ".checkpoint"),
+            resume=args.resume,
+            interval=(
+                DEFAULT_CHECKPOINT_INTERVAL
+                if args.checkpoint_interval is None
+                else args.checkpoint_interval
+            ),
+            report_every=args.report_every,
+            subreddits=args.subreddit,
+            workers=args.workers,
+            max_threads=args.max_threads,
+            min_comments=args.min_comments,
+            json_backend=args.json_backend,
+        )
+        return
+
+    encode = thread_encoder(args.output_path, comment_rows=bool(args.comments_parquet))
+    records: Iterable[object]
+    if args.state_dir:
+        lines = reconstruct_incremental(
+            args.input_paths,
+            args.state_dir,
+            partitions=args.partitions,
+            subreddits=args.subreddit,
+            min_comments=args.min_comments,
+            max_threads=args.max_threads,
+            report_every=args.report_every,
+            workers=args.workers,
+            partition_workers=args.partition_workers,
+            json_backend=args.json_backend,
+        )
+        records = records_from_lines(lines, args.output_path)
+    elif len(args.input_paths) > 1 or args.partitions:
+        lines = reconstruct_partitioned(
+            args.input_paths,
+            args.output_path,
+            partitions=args.partitions or DEFAULT_PARTITIONS,
+            subreddits=args.subreddit,
+            min_comments=args.min_comments,
+            max_threads=args.max_threads,
+            report_every=args.report_every,
+            workers=args.workers,
+            partition_workers=args.partition_workers,
+            spill_dir=args.spill_dir,
+            json_backend=args.json_backend,
+        )
+        records = records_from_lines(lines, args.output_path)
+    elif args.prescan or args.max_threads:
+        records = reconstruct_with_prescan(
+            input_path,
+            report_every=args.report_every,
+            subreddits=args.subreddit,
+            workers=args.workers,
+            max_threads=args.max_threads,
+            min_comments=args.min_comments,
+            json_backend=args.json_backend,
+            encode=encode,
+        )
+    else:
+        store = read_comments(
+            input_path,
+            report_every=args.report_every,
+            record_filter=RecordFilter(subreddits=args.subreddit),
+            workers=args.workers,
+            json_backend=args.json_backend,
+        )
+        children = attach_children(store)
+        records = reconstruct_thread_lines(
+            store,
+            children,
+            max_threads=args.max_threads,
+            min_comments=args.min_comments,
+            workers=args.workers,
+            encode=encode,
+        )
+    if args.comments_parquet:
+        records = export_comment_rows(records, args.comments_parquet)
+    write_thread_records(records, args.output_path)
 
 
 if __name__ == "__main__":
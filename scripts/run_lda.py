@@ -8,10 +8,14 @@ from __future__ import annotations
 import argparse
 import json
 import sys
+import tempfile
+from collections import Counter
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import numpy as np
+import sklearn
+from scipy import sparse
 from sklearn.decomposition import LatentDirichletAllocation
 from sklearn.feature_extraction.text import CountVectorizer
 
@@ -20,6 +24,18 @@ PROJECT_ROOT = SCRIPT_DIR.parent
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+from scripts.compressed_io import open_text
+from scripts.lda_cache import (
+    StreamedCorpus,
+    StreamedCorpusWriter,
+    VectorizedCorpus,
+    cache_entry_path,
+    corpus_fingerprint,
+    streamed_entry_path,
+)
+
+DOCS_PER_PART = 10_000
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -80,8 +96,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--learning-method",
         choices=["batch", "online"],
-        default="batch",
-        help="Learning algorithm to use (batch or online).",
+        default=None,
+        help="Learning algorithm to use (default: batch, or online with --streaming).",
     )
     parser.add_argument(
         "--batch-size",
@@ -89,57 +105,305 @@ def parse_args() -> argparse.Namespace:
         default=1024,
         help="Mini-batch size for online learning (ignored for batch method).",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=None,
+        help="Where tokenized corpora are cached, keyed by the corpus contents and "
+        "the vectorizer settings (default: lda_cache/ next to the corpus).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always tokenize the corpus, and do not write a cache entry.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Out-of-core mode: read the corpus lazily, tokenize it in two passes "
+        "(vocabulary, then counts) into on-disk blocks, and train with online "
+        "partial_fit updates, so neither the texts nor the full document-term "
+        "matrix are held in memory.",
+    )
+    args = parser.parse_args()
+    if args.streaming and args.learning_method == "batch":
+        parser.error("--streaming trains with online updates; drop --learning-method batch")
+    if args.learning_method is None:
+        args.learning_method = "online" if args.streaming else "batch"
+    return args
 
 
-def load_corpus(
+def iter_corpus(
     path: Path,
     max_docs: int | None = None,
-) -> Tuple[List[str], List[dict]]:
-    texts: List[str] = []
-    meta: List[dict] = []
-    with path.open("r", encoding="utf-8") as handle:
-        for line_no, line in enumerate(handle):
+) -> Iterator[Tuple[str, dict]]:
+    """(text, metadata) per non-empty document, read lazily."""
+    loaded = 0
+    with open_text(path) as handle:
+        for line in handle:
             if not line.strip():
                 continue
             record = json.loads(line)
             text = record.get("text", "").strip()
             if not text:
                 continue
-            texts.append(text)
-            meta.append(
-                {
-                    "link_id": record["link_id"],
-                    "subreddit": record["subreddit"],
-                    "comment_count": record["comment_count"],
-                    "created_utc_min": record["created_utc_min"],
-                    "created_utc_max": record["created_utc_max"],
-                }
-            )
-            if max_docs and len(texts) >= max_docs:
+            yield text, {
+                "link_id": record["link_id"],
+                "subreddit": record["subreddit"],
+                "comment_count": record["comment_count"],
+                "created_utc_min": record["created_utc_min"],
+                "created_utc_max": record["created_utc_max"],
+            }
+            loaded += 1
+            if max_docs and loaded >= max_docs:
                 break
+
+
+def load_corpus(
+    path: Path,
+    max_docs: int | None = None,
+) -> Tuple[List[str], List[dict]]:
+    texts: List[str] = []
+    meta: List[dict] = []
+    for text, info in iter_corpus(path, max_docs):
+        texts.append(text)
+        meta.append(info)
     if not texts:
         raise ValueError("No documents loaded from corpus.")
     return texts, meta
 
 
-def train_lda(
-    texts: List[str],
+def vectorize_corpus(
+    corpus_path: Path,
     *,
-    num_topics: int,
+    max_docs: int | None,
     max_features: int,
     min_df: int,
-    random_state: int,
-    max_iter: int,
-    learning_method: str,
-    batch_size: int,
-) -> Tuple[LatentDirichletAllocation, CountVectorizer, np.ndarray]:
+) -> VectorizedCorpus:
+    texts, meta = load_corpus(corpus_path, max_docs=max_docs)
     vectorizer = CountVectorizer(
         max_features=max_features,
         min_df=min_df,
         stop_words="english",
     )
     doc_term = vectorizer.fit_transform(texts)
+    return VectorizedCorpus(
+        doc_term=doc_term,
+        feature_names=vectorizer.get_feature_names_out(),
+        meta=meta,
+    )
+
+
+def load_vectorized_corpus(
+    corpus_path: Path,
+    cache_dir: Path | None,
+    *,
+    max_docs: int | None,
+    max_features: int,
+    min_df: int,
+) -> VectorizedCorpus:
+    """
+    Tokenized corpus for these settings, from the cache when an entry exists
+    (``cache_dir`` None disables the cache).
+    """
+    if cache_dir is None:
+        return vectorize_corpus(
+            corpus_path, max_docs=max_docs, max_features=max_features, min_df=min_df
+        )
+
+    settings = vectorizer_settings(max_docs, max_features, min_df)
+    entry_path = cache_entry_path(cache_dir, corpus_fingerprint(corpus_path, settings))
+    if entry_path.exists():
+        print(f"Using tokenized corpus cached in {entry_path}", flush=True)
+        return VectorizedCorpus.load(entry_path)
+
+    corpus = vectorize_corpus(
+        corpus_path, max_docs=max_docs, max_features=max_features, min_df=min_df
+    )
+    corpus.save(entry_path)
+    print(f"Cached tokenized corpus in {entry_path}", flush=True)
+    return corpus
+
+
+def vectorizer_settings(max_docs: int | None, max_features: int, min_df: int) -> Dict:
+    """Everything the tokenized corpus depends on besides the corpus itself."""
+    return {
+        "max_docs": max_docs,
+        "max_features": max_features,
+        "min_df": min_df,
+        "stop_words": "english",
+        "sklearn": sklearn.__version__,
+    }
+
+
+def build_vocabulary(
+    corpus_path: Path,
+    *,
+    max_docs: int | None,
+    max_features: int,
+    min_df: int,
+) -> np.ndarray:
+    """
+    First streaming pass: the vocabulary ``CountVectorizer`` would pick for
+    the whole corpus, from per-term counts gathered one document at a time.
+    """
+    analyze = CountVectorizer(stop_words="english").build_analyzer()
+    doc_freq: Counter = Counter()
+    term_freq: Counter = Counter()
+    documents = 0
+    for text, _ in iter_corpus(corpus_path, max_docs):
+        tokens = analyze(text)
+        term_freq.update(tokens)
+        doc_freq.update(set(tokens))
+        documents += 1
+    if not documents:
+        raise ValueError("No documents loaded from corpus.")
+
+    terms = np.array(sorted(doc_freq), dtype=object)
+    dfs = np.array([doc_freq[term] for term in terms], dtype=np.int64)
+    keep = np.flatnonzero(dfs >= min_df)
+    if max_features is not None and len(keep) > max_features:
+        # Same selection, ties included, as CountVectorizer._limit_features.
+        tfs = np.array([term_freq[term] for term in terms], dtype=np.int64)
+        keep = np.sort(keep[(-tfs[keep]).argsort()[:max_features]])
+    if not len(keep):
+        raise ValueError("After pruning, no terms remain. Try a lower --min-df.")
+    print(
+        f"Vocabulary: kept {len(keep):,} of {len(terms):,} terms "
+        f"from {documents:,} documents.",
+        flush=True,
+    )
+    return terms[keep]
+
+
+def stream_vectorized_corpus(
+    corpus_path: Path,
+    directory: Path,
+    *,
+    max_docs: int | None,
+    max_features: int,
+    min_df: int,
+) -> StreamedCorpus:
+    """Tokenize the corpus in two passes into on-disk blocks of ``DOCS_PER_PART`` rows."""
+    feature_names = build_vocabulary(
+        corpus_path, max_docs=max_docs, max_features=max_features, min_df=min_df
+    )
+    vectorizer = CountVectorizer(
+        vocabulary={term: idx for idx, term in enumerate(feature_names)},
+        stop_words="english",
+    )
+    writer = StreamedCorpusWriter(directory)
+    texts: List[str] = []
+    meta: List[dict] = []
+    for text, info in iter_corpus(corpus_path, max_docs):
+        texts.append(text)
+        meta.append(info)
+        if len(texts) >= DOCS_PER_PART:
+            writer.add_part(vectorizer.transform(texts), meta)
+            texts, meta = [], []
+    if texts:
+        writer.add_part(vectorizer.transform(texts), meta)
+    return writer.close(feature_names)
+
+
+def load_streamed_corpus(
+    corpus_path: Path,
+    cache_dir: Path,
+    *,
+    max_docs: int | None,
+    max_features: int,
+    min_df: int,
+) -> StreamedCorpus:
+    """Streamed counterpart of :func:`load_vectorized_corpus`; the blocks live in ``cache_dir``."""
+    settings = vectorizer_settings(max_docs, max_features, min_df)
+    entry_path = streamed_entry_path(cache_dir, corpus_fingerprint(corpus_path, settings))
+    corpus = StreamedCorpus.load(entry_path)
+    if corpus is not None:
+        print(f"Using tokenized corpus cached in {entry_path}", flush=True)
+        return corpus
+
+    corpus = stream_vectorized_corpus(
+        corpus_path,
+        entry_path,
+        max_docs=max_docs,
+        max_features=max_features,
+        min_df=min_df,
+    )
+    print(f"Cached tokenized corpus in {entry_path}", flush=True)
+    return corpus
+
+
+def iter_aligned_blocks(
+    parts: Iterable[sparse.csr_matrix],
+    batch_size: int,
+) -> Iterator[sparse.csr_matrix]:
+    """
+    Regroup row blocks so every block but the last holds a multiple of
+    ``batch_size`` rows, and ``partial_fit`` sees the same mini-batches as
+    ``fit`` would on the whole matrix.
+    """
+    pending: List[sparse.csr_matrix] = []
+    rows = 0
+    for part in parts:
+        pending.append(part)
+        rows += part.shape[0]
+        if rows < batch_size:
+            continue
+        block = sparse.vstack(pending, format="csr") if len(pending) > 1 else part
+        aligned = rows - rows % batch_size
+        yield block[:aligned]
+        pending = [block[aligned:]] if aligned < rows else []
+        rows -= aligned
+    if rows:
+        yield sparse.vstack(pending, format="csr")
+
+
+def train_lda_streaming(
+    corpus: StreamedCorpus,
+    *,
+    num_topics: int,
+    random_state: int,
+    max_iter: int,
+    batch_size: int,
+) -> LatentDirichletAllocation:
+    """
+    Online LDA with one block of the corpus in memory at a time. Each of the
+    ``max_iter`` passes makes the same updates as ``fit`` with
+    ``learning_method="online"``.
+    """
+    lda = LatentDirichletAllocation(
+        n_components=num_topics,
+        learning_method="online",
+        batch_size=batch_size,
+        max_iter=max_iter,
+        total_samples=corpus.documents,
+        random_state=random_state,
+    )
+    for iteration in range(1, max_iter + 1):
+        parts = (doc_term for doc_term, _ in corpus.iter_parts())
+        for block in iter_aligned_blocks(parts, batch_size):
+            lda.partial_fit(block)
+        print(f"Finished pass {iteration}/{max_iter} over the corpus.", flush=True)
+    return lda
+
+
+def iter_doc_topics(
+    lda: LatentDirichletAllocation,
+    corpus: StreamedCorpus,
+) -> Iterator[Tuple[np.ndarray, dict]]:
+    for doc_term, meta in corpus.iter_parts():
+        yield from zip(lda.transform(doc_term), meta)
+
+
+def train_lda(
+    doc_term: sparse.csr_matrix,
+    *,
+    num_topics: int,
+    random_state: int,
+    max_iter: int,
+    learning_method: str,
+    batch_size: int,
+) -> Tuple[LatentDirichletAllocation, np.ndarray]:
     lda = LatentDirichletAllocation(
         n_components=num_topics,
         learning_method=learning_method,
@@ -149,16 +413,15 @@ def train_lda(
     )
     lda.fit(doc_term)
     doc_topic = lda.transform(doc_term)
-    return lda, vectorizer, doc_topic
+    return lda, doc_topic
 
 
 def save_topics(
     lda: LatentDirichletAllocation,
-    vectorizer: CountVectorizer,
+    feature_names: np.ndarray,
     top_words: int,
     output_path: Path,
 ) -> None:
-    feature_names = np.array(vectorizer.get_feature_names_out())
     topics = []
     for topic_idx, topic in enumerate(lda.components_):
         top_indices = topic.argsort()[::-1][:top_words]
@@ -173,12 +436,11 @@ def save_topics(
 
 
 def save_doc_topics(
-    doc_topic: np.ndarray,
-    meta: List[dict],
+    doc_topics: Iterable[Tuple[np.ndarray, dict]],
     output_path: Path,
 ) -> None:
     with output_path.open("w", encoding="utf-8") as handle:
-        for weights, info in zip(doc_topic, meta):
+        for weights, info in doc_topics:
             record = {
                 **info,
                 "topic_distribution": weights.tolist(),
@@ -194,14 +456,41 @@ def main() -> None:
     if not args.corpus_path.exists():
         raise FileNotFoundError(f"Corpus file not found: {args.corpus_path}")
 
-    texts, meta = load_corpus(args.corpus_path, max_docs=args.max_docs)
-    print(f"Loaded {len(texts):,} documents for LDA training.", flush=True)
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or args.corpus_path.parent / "lda_cache"
+    if args.streaming:
+        vectorizer_args = {
+            "max_docs": args.max_docs,
+            "max_features": args.max_features,
+            "min_df": args.min_df,
+        }
+        if cache_dir is None:
+            # No fingerprint and no cache entry: the blocks only live as long
+            # as this run.
+            args.output_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=args.output_dir) as work_dir:
+                streamed = stream_vectorized_corpus(
+                    args.corpus_path, Path(work_dir) / "corpus", **vectorizer_args
+                )
+                run_streaming(args, streamed)
+        else:
+            streamed = load_streamed_corpus(args.corpus_path, cache_dir, **vectorizer_args)
+            run_streaming(args, streamed)
+        return
 
-    lda, vectorizer, doc_topic = train_lda(
-        texts,
-        num_topics=args.num_topics,
+    corpus = load_vectorized_corpus(
+        args.corpus_path,
+        cache_dir,
+        max_docs=args.max_docs,
         max_features=args.max_features,
         min_df=args.min_df,
+    )
+    print(f"Loaded {len(corpus.meta):,} documents for LDA training.", flush=True)
+
+    lda, doc_topic = train_lda(
+        corpus.doc_term,
+        num_topics=args.num_topics,
         random_state=args.random_state,
         max_iter=args.max_iter,
         learning_method=args.learning_method,
@@ -213,8 +502,30 @@ def main() -> None:
     topics_path = args.output_dir / "topics.json"
     doc_topics_path = args.output_dir / "doc_topics.jsonl"
 
-    save_topics(lda, vectorizer, args.top_words, topics_path)
-    save_doc_topics(doc_topic, meta, doc_topics_path)
+    save_topics(lda, corpus.feature_names, args.top_words, topics_path)
+    save_doc_topics(zip(doc_topic, corpus.meta), doc_topics_path)
+    print(f"Wrote topics to {topics_path}")
+    print(f"Wrote document-topic weights to {doc_topics_path}")
+
+
+def run_streaming(args: argparse.Namespace, corpus: StreamedCorpus) -> None:
+    print(f"Streaming {corpus.documents:,} documents for LDA training.", flush=True)
+
+    lda = train_lda_streaming(
+        corpus,
+        num_topics=args.num_topics,
+        random_state=args.random_state,
+        max_iter=args.max_iter,
+        batch_size=args.batch_size,
+    )
+    print("LDA training complete.", flush=True)
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    topics_path = args.output_dir / "topics.json"
+    doc_topics_path = args.output_dir / "doc_topics.jsonl"
+
+    save_topics(lda, corpus.feature_names, args.top_words, topics_path)
+    save_doc_topics(iter_doc_topics(lda, corpus), doc_topics_path)
     print(f"Wrote topics to {topics_path}")
     print(f"Wrote document-topic weights to {doc_topics_path}")
 
@@ -0,0 +1,38 @@
+"""
+Staging directories for outputs that are only moved into place once complete,
+shared by the Parquet export and the streamed LDA cache.
+
+A staging directory is always freshly created by :func:`make_staging_dir`
+under a unique name, so deleting it can never remove a directory the user
+made. A run that fails leaves its staging directory (``<name>.XXXXXXXX``
+next to the target) behind for inspection; it is safe to delete.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def make_staging_dir(target: Path) -> Path:
+    """A new, empty directory next to ``target`` that belongs to the caller."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(dir=target.parent, prefix=target.name + "."))
+
+
+def move_into_place(staged: Path, target: Path) -> None:
+    """
+    Move the finished directory ``staged`` to ``target``. An existing
+    ``target`` is first moved into a staging directory of its own, so the
+    new contents appear with one rename and only the replaced directory is
+    deleted.
+    """
+    if not target.exists():
+        os.replace(staged, target)
+        return
+    replaced = make_staging_dir(target)
+    os.replace(target, replaced / target.name)
+    os.replace(staged, target)
+    shutil.rmtree(replaced)
@@ -21,21 +21,24 @@ def format_body(body: Optional[str], max_chars: int) -> str:
 
 def render_comment(comment: Dict, *, max_body_chars: int, depth: int = 0) -> List[str]:
     lines: List[str] = []
-    indent = "  " * depth
-    author = comment.get("author") or "[unknown]"
-    timestamp = human_time(comment["created_utc"])
-    net_votes = comment.get("net_votes", comment.get("score", 0))
-    body = format_body(comment.get("body"), max_body_chars)
-    meta = f"{indent}- {author} | net votes={net_votes} | {timestamp}"
-    lines.append(meta)
-    if body:
-        width = max(20, 100 - len(indent))
-        wrapped = textwrap.wrap(body, width=width)
-        for line in wrapped:
-            lines.append(f"{indent}  {line}")
-    for child in comment.get("children", []):
-        lines.extend(
-            render_comment(child, max_body_chars=max_body_chars, depth=depth + 1)
+    # Explicit stack: reply chains can be nested deeper than the recursion limit.
+    stack = [(comment, depth)]
+    while stack:
+        comment, depth = stack.pop()
+        indent = "  " * depth
+        author = comment.get("author") or "[unknown]"
+        timestamp = human_time(comment["created_utc"])
+        net_votes = comment.get("net_votes", comment.get("score", 0))
+        body = format_body(comment.get("body"), max_body_chars)
+        meta = f"{indent}- {author} | net votes={net_votes} | {timestamp}"
+        lines.append(meta)
+        if body:
+            width = max(20, 100 - len(indent))
+            wrapped = textwrap.wrap(body, width=width)
+            for line in wrapped:
+                lines.append(f"{indent}  {line}")
+        stack.extend(
+            (child, depth + 1) for child in reversed(comment.get("children", []))
         )
     return lines
 
@@ -0,0 +1,568 @@
+"""
+Compact columnar storage for reconstructed threads, and one loader for both
+thread formats.
+
+The JSONL threads repeat every key on every comment node and have to be
+parsed back in full. A thread store (``.npz``) keeps the nodes in flat
+columns instead: nodes are laid out thread by thread in pre-order, each
+node records the position of its parent within its thread, repeated
+values (authors, subreddits, ...) are dictionary-encoded and text columns
+are stored as one JSON array each. Threads are split into row groups
+(``groupNNNNN/<column>`` members, deflate-compressed) so that writing and
+reading only ever hold one group; the top-level ``link_ids`` and
+``group_offsets`` members index them. ``iter_threads`` and
+``load_thread`` read either format (JSONL may be compressed) and return
+the usual nested dicts; JSONL records too deep for the stdlib decoder are
+decoded with an explicit stack, like ``encode_thread`` writes them.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import zipfile
+from array import array
+from dataclasses import dataclass
+from json.scanner import NUMBER_RE
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from scripts.comment_store import CategoricalBuilder, CategoricalColumn
+from scripts.compressed_io import iter_lines
+from scripts.reddit_ids import decode_id, encode_id
+
+THREAD_STORE_SUFFIX = ".npz"
+STORE_VERSION = 1
+# Comments per row group: the unit the writer flushes and readers decode.
+GROUP_NODES = 100_000
+
+# Separator before the last key of a JSONL thread record. Quotes inside
+# string values are escaped, so it cannot occur earlier in the line.
+_ROOTS_KEY = b', "roots": '
+
+# Keys of a comment node besides "children", in output order.
+NODE_KEYS = (
+    "id",
+    "parent_id",
+    "author",
+    "body",
+    "body_cleaned",
+    "net_votes",
+    "controversiality",
+    "created_utc",
+    "distinguished",
+    "edited",
+)
+
+_INT_THREAD_COLUMNS = (
+    "comment_count",
+    "root_count",
+    "created_utc_min",
+    "created_utc_max",
+    "orphan_comments",
+)
+# Thread-level keys written before "roots".
+_HEADER_KEYS = ("link_id", "subreddit") + _INT_THREAD_COLUMNS
+_INT_NODE_COLUMNS = ("net_votes", "controversiality", "created_utc")
+_NODE_CATEGORICAL_COLUMNS = ("author", "distinguished", "edited")
+_CATEGORICAL_COLUMNS = ("subreddit",) + _NODE_CATEGORICAL_COLUMNS
+# Comment ids are kept as strings: decoding integer codes one node at a
+# time costs more than reading them back as text.
+_TEXT_COLUMNS = ("id", "parent_id", "body", "body_cleaned")
+
+
+def is_thread_store(path: Path) -> bool:
+    return path.suffix.lower() == THREAD_STORE_SUFFIX
+
+
+@dataclass
+class FlatThread:
+    """
+    A thread with its comment nodes flattened in pre-order: ``parents[i]``
+    is the position of node ``i``'s parent (-1 for roots) and
+    ``nodes[key][i]`` its value for each key in ``NODE_KEYS``. Unlike the
+    nested dicts it pickles cheaply however deep the thread is.
+    """
+
+    header: Dict
+    parents: List[int]
+    nodes: Dict[str, List]
+
+
+def flatten_thread(thread: Dict) -> FlatThread:
+    header = {key: value for key, value in thread.items() if key != "roots"}
+    parents: List[int] = []
+    nodes: Dict[str, List] = {key: [] for key in NODE_KEYS}
+    stack = [(root, -1) for root in reversed(thread["roots"])]
+    while stack:
+        node, parent = stack.pop()
+        position = len(parents)
+        parents.append(parent)
+        for key in NODE_KEYS:
+            nodes[key].append(node.get(key))
+        stack.extend((child, position) for child in reversed(node.get("children", [])))
+    return FlatThread(header=header, parents=parents, nodes=nodes)
+
+
+def _text_array(values: List[Optional[str]]) -> np.ndarray:
+    # A JSON array decodes back to a list of str in one C call; keeping the
+    # text unescaped lets the compressor see the raw bytes.
+    data = json.dumps(values, ensure_ascii=False).encode("utf-8", "surrogatepass")
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _text_list(array: np.ndarray) -> List[Optional[str]]:
+    return json.loads(array.tobytes().decode("utf-8", "surrogatepass"))
+
+
+class ThreadStoreWriter:
+    """
+    Write flattened threads to a ``.npz`` thread store, one row group of
+    about ``group_nodes`` comments at a time, so memory is bounded by a
+    group rather than by the output. Members are deflate-compressed; the
+    archive is built next to ``path`` and renamed into place by
+    :meth:`close`.
+    """
+
+    def __init__(self, path: Path, group_nodes: int = GROUP_NODES) -> None:
+        self.path = path
+        self.tmp_path = path.with_name(path.name + ".tmp")
+        self.group_nodes = group_nodes
+        self.archive = zipfile.ZipFile(
+            self.tmp_path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True
+        )
+        self.link_ids = array("q")
+        self.group_offsets = array("q", [0])
+        self._start_group()
+
+    def _start_group(self) -> None:
+        self.subreddits = CategoricalBuilder()
+        self.thread_ints = {name: array("q") for name in _INT_THREAD_COLUMNS}
+        self.node_offsets = array("q", [0])
+        self.parents = array("i")
+        self.node_ints = {name: array("q") for name in _INT_NODE_COLUMNS}
+        self.categoricals = {name: CategoricalBuilder() for name in _NODE_CATEGORICAL_COLUMNS}
+        self.texts: Dict[str, List[Optional[str]]] = {name: [] for name in _TEXT_COLUMNS}
+        self.cleaned_is_body = array("b")
+
+    def __len__(self) -> int:
+        return len(self.link_ids)
+
+    def add(self, thread: FlatThread) -> None:
+        header = thread.header
+        self.link_ids.append(encode_id(header["link_id"]))
+        self.subreddits.append(header["subreddit"])
+        for name in _INT_THREAD_COLUMNS:
+            self.thread_ints[name].append(header[name])
+        self.node_offsets.append(self.node_offsets[-1] + len(thread.parents))
+        self.parents.extend(thread.parents)
+
+        nodes = thread.nodes
+        self.texts["id"].extend(nodes["id"])
+        self.texts["parent_id"].extend(nodes["parent_id"])
+        for name in _INT_NODE_COLUMNS:
+            self.node_ints[name].extend(nodes[name])
+        for name in _NODE_CATEGORICAL_COLUMNS:
+            builder = self.categoricals[name]
+            for value in nodes[name]:
+                builder.append(value)
+        for body, cleaned in zip(nodes["body"], nodes["body_cleaned"]):
+            self.texts["body"].append(body)
+            # body_cleaned often equals body; store those bytes only once.
+            same = cleaned is not None and cleaned == body
+            self.cleaned_is_body.append(same)
+            self.texts["body_cleaned"].append(None if same else cleaned)
+
+        if len(self.parents) >= self.group_nodes:
+            self._flush_group()
+
+    def _write_array(self, name: str, values: np.ndarray) -> None:
+        with self.archive.open(name + ".npy", "w", force_zip64=True) as handle:
+            np.lib.format.write_array(handle, values, allow_pickle=False)
+
+    def _write_categorical(self, name: str, builder: CategoricalBuilder) -> None:
+        column = builder.build()
+        self._write_array(f"{name}.codes", column.codes)
+        # JSON keeps True, 1 and 1.0 apart, like the interner does.
+        self._write_array(f"{name}.values", np.array(json.dumps(column.values)))
+
+    def _flush_group(self) -> None:
+        if len(self.link_ids) == self.group_offsets[-1]:
+            return
+        prefix = _group_prefix(len(self.group_offsets) - 1)
+        self._write_categorical(prefix + "subreddit", self.subreddits)
+        for columns in (self.thread_ints, self.node_ints):
+            for name, ints in columns.items():
+                self._write_array(prefix + name, np.frombuffer(ints, dtype=np.int64))
+        self._write_array(prefix + "node_offsets", np.frombuffer(self.node_offsets, dtype=np.int64))
+        self._write_array(prefix + "parents", np.frombuffer(self.parents, dtype=np.int32))
+        self._write_array(
+            prefix + "cleaned_is_body", np.frombuffer(self.cleaned_is_body, dtype=np.int8)
+        )
+        for name, builder in self.categoricals.items():
+            self._write_categorical(prefix + name, builder)
+        for name, values in self.texts.items():
+            self._write_array(prefix + name, _text_array(values))
+        self.group_offsets.append(len(self.link_ids))
+        self._start_group()
+
+    def close(self) -> None:
+        self._flush_group()
+        self._write_array("version", np.array(STORE_VERSION))
+        self._write_array("link_ids", np.frombuffer(self.link_ids, dtype=np.int64))
+        self._write_array("group_offsets", np.frombuffer(self.group_offsets, dtype=np.int64))
+        self.archive.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def write_thread_store(threads: Iterator[FlatThread], path: Path) -> int:
+    """Save ``threads`` to ``path`` and return how many were written."""
+    writer = ThreadStoreWriter(path)
+    for thread in threads:
+        writer.add(thread)
+    writer.close()
+    return len(writer)
+
+
+def _group_prefix(group: int) -> str:
+    return f"group{group:05d}/"
+
+
+class ThreadGroup:
+    """One row group of a thread store; columns are decoded on first use."""
+
+    def __init__(self, data: np.lib.npyio.NpzFile, group: int) -> None:
+        self.data = data
+        self.prefix = _group_prefix(group)
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._texts: Dict[str, List[Optional[str]]] = {}
+        self._categoricals: Dict[str, CategoricalColumn] = {}
+        self.node_offsets = self._member("node_offsets")
+
+    def _member(self, name: str) -> np.ndarray:
+        return self.data[self.prefix + name]
+
+    def array(self, name: str) -> np.ndarray:
+        """A numeric column (``cleaned_is_body`` as booleans)."""
+        if name not in self._arrays:
+            values = self._member(name)
+            self._arrays[name] = values.astype(bool) if name == "cleaned_is_body" else values
+        return self._arrays[name]
+
+    def text(self, name: str) -> List[Optional[str]]:
+        if name not in self._texts:
+            self._texts[name] = _text_list(self._member(name))
+        return self._texts[name]
+
+    def categorical(self, name: str) -> CategoricalColumn:
+        if name not in self._categoricals:
+            self._categoricals[name] = CategoricalColumn(
+                self._member(f"{name}.codes"),
+                json.loads(str(self._member(f"{name}.values"))),
+            )
+        return self._categoricals[name]
+
+    def header(self, idx: int) -> Dict:
+        header: Dict = {"subreddit": self.categorical("subreddit").get(idx)}
+        for name in _INT_THREAD_COLUMNS:
+            header[name] = int(self.array(name)[idx])
+        return header
+
+    def node_span(self, idx: int) -> Tuple[int, int]:
+        return int(self.node_offsets[idx]), int(self.node_offsets[idx + 1])
+
+    def bodies(self, idx: int) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        start, stop = self.node_span(idx)
+        bodies = self.text("body")[start:stop]
+        cleaned = self.text("body_cleaned")[start:stop]
+        same = self.array("cleaned_is_body")[start:stop].tolist()
+        return bodies, [
+            body if is_same else text for body, text, is_same in zip(bodies, cleaned, same)
+        ]
+
+    def _categorical_slice(self, name: str, start: int, stop: int) -> List[object]:
+        column = self.categorical(name)
+        values = column.values
+        return [values[code] for code in column.codes[start:stop].tolist()]
+
+    def roots(self, idx: int) -> List[Dict]:
+        start, stop = self.node_span(idx)
+        bodies, cleaned = self.bodies(idx)
+        columns = zip(
+            self.text("id")[start:stop],
+            self.text("parent_id")[start:stop],
+            self._categorical_slice("author", start, stop),
+            bodies,
+            cleaned,
+            self.array("net_votes")[start:stop].tolist(),
+            self.array("controversiality")[start:stop].tolist(),
+            self.array("created_utc")[start:stop].tolist(),
+            self._categorical_slice("distinguished", start, stop),
+            self._categorical_slice("edited", start, stop),
+        )
+        roots: List[Dict] = []
+        nodes: List[Dict] = []
+        parents = self.array("parents")[start:stop].tolist()
+        for parent, values in zip(parents, columns):
+            node = dict(zip(NODE_KEYS, values))
+            node["children"] = []
+            nodes.append(node)
+            (roots if parent < 0 else nodes[parent]["children"]).append(node)
+        return roots
+
+
+class ThreadStore:
+    """
+    Read access to a thread store; threads are indexed in file order. Only
+    the link_id index is read up front, and one row group is kept decoded
+    at a time, so reading threads in order touches each group once.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.data = np.load(path)
+        if "version" not in self.data.files or int(self.data["version"]) != STORE_VERSION:
+            self.data.close()
+            raise ValueError(f"Unsupported thread store version in {path}")
+        self.link_ids = self.data["link_ids"]
+        self.group_offsets = self.data["group_offsets"]
+        self._cached_index = -1
+        self._cached_group: Optional[ThreadGroup] = None
+
+    def __len__(self) -> int:
+        return len(self.link_ids)
+
+    @property
+    def group_count(self) -> int:
+        return len(self.group_offsets) - 1
+
+    def group_threads(self, group: int) -> range:
+        """Indexes of the threads in row group ``group``."""
+        return range(int(self.group_offsets[group]), int(self.group_offsets[group + 1]))
+
+    def group(self, group: int) -> ThreadGroup:
+        if self._cached_group is None or self._cached_index != group:
+            self._cached_index = group
+            self._cached_group = ThreadGroup(self.data, group)
+        return self._cached_group
+
+    def _locate(self, idx: int) -> Tuple[ThreadGroup, int]:
+        group = int(np.searchsorted(self.group_offsets, idx, side="right")) - 1
+        return self.group(group), idx - int(self.group_offsets[group])
+
+    def find(self, link_id: str) -> Optional[int]:
+        """Index of the thread for ``link_id``, or None."""
+        matches = np.flatnonzero(self.link_ids == encode_id(link_id))
+        return int(matches[0]) if len(matches) else None
+
+    def header(self, idx: int) -> Dict:
+        """Thread-level fields of thread ``idx`` (everything but ``roots``)."""
+        group, local = self._locate(idx)
+        return {"link_id": decode_id(self.link_ids[idx]), **group.header(local)}
+
+    def bodies(self, idx: int) -> Tuple[List[Optional[str]], List[Optional[str]]]:
+        """``body`` and ``body_cleaned`` of thread ``idx``'s comments, in pre-order."""
+        group, local = self._locate(idx)
+        return group.bodies(local)
+
+    def thread(self, idx: int) -> Dict:
+        """Thread ``idx`` as the same nested dict its JSONL record decodes to."""
+        group, local = self._locate(idx)
+        thread = {"link_id": decode_id(self.link_ids[idx]), **group.header(local)}
+        thread["roots"] = group.roots(local)
+        return thread
+
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(len(self)):
+            yield self.thread(idx)
+
+    def close(self) -> None:
+        self.data.close()
+
+
+def read_thread_header(line: bytes) -> Dict:
+    """
+    The summary fields of a JSONL thread record (link_id, comment_count,
+    ...) without decoding its comments. ``reconstruct_threads.py`` writes
+    ``roots`` as the last key, so the header is everything before it;
+    records laid out differently (any summary field missing before
+    ``roots``) are decoded in full.
+    """
+    cut = line.find(_ROOTS_KEY)
+    if cut >= 0:
+        try:
+            header = json.loads(line[:cut] + b"}")
+        except ValueError:
+            pass
+        else:
+            if all(key in header for key in _HEADER_KEYS):
+                return header
+    return decode_thread(line)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Only ever handed a string token, which it decodes without recursing.
+_STRINGS = json.JSONDecoder()
+_CONSTANTS = {
+    "true": True,
+    "false": False,
+    "null": None,
+    "NaN": float("nan"),
+    "Infinity": float("inf"),
+    "-Infinity": float("-inf"),
+}
+
+
+def decode_thread(line: Union[bytes, str]) -> Dict:
+    """
+    ``json.loads`` for a JSONL thread record. The C decoder recurses once
+    per nesting level, so records too deep for it are decoded again with an
+    explicit stack.
+    """
+    try:
+        return json.loads(line)
+    except RecursionError:
+        pass
+    text = line.decode("utf-8") if isinstance(line, bytes) else line
+    try:
+        thread = _loads_iterative(text)
+    except IndexError:
+        raise ValueError("Truncated JSON thread record") from None
+    if not isinstance(thread, dict):
+        raise ValueError("A JSON thread record must be an object")
+    return thread
+
+
+def _skip(text: str, idx: int) -> int:
+    match = _WHITESPACE.match(text, idx)
+    assert match is not None  # the pattern also matches the empty string
+    return match.end()
+
+
+def _read_key(text: str, idx: int) -> Tuple[str, int]:
+    """Object key starting at ``idx``; returns it and the index of its value."""
+    if text[idx] != '"':
+        raise ValueError(f"Expected an object key at offset {idx}")
+    key, idx = _STRINGS.raw_decode(text, idx)
+    idx = _skip(text, idx)
+    if text[idx] != ":":
+        raise ValueError(f"Expected ':' at offset {idx}")
+    return key, _skip(text, idx + 1)
+
+
+def _loads_iterative(text: str) -> object:
+    # Each stack entry is an open container and, for objects, the key its
+    # next value belongs to.
+    stack: List[List] = []
+    idx = _skip(text, 0)
+    while True:
+        char = text[idx]
+        if char in "{[":
+            container: Union[Dict, List] = {} if char == "{" else []
+            idx = _skip(text, idx + 1)
+            if text[idx] != ("}" if char == "{" else "]"):
+                key = None
+                if char == "{":
+                    key, idx = _read_key(text, idx)
+                stack.append([container, key])
+                continue
+            value: object = container
+            idx += 1
+        elif char == '"':
+            value, idx = _STRINGS.raw_decode(text, idx)
+        else:
+            match = NUMBER_RE.match(text, idx)
+            if match is not None:
+                integer, fraction, exponent = match.groups()
+                if fraction or exponent:
+                    value = float(integer + (fraction or "") + (exponent or ""))
+                else:
+                    value = int(integer)
+                idx = match.end()
+            else:
+                for literal, constant in _CONSTANTS.items():
+                    if text.startswith(literal, idx):
+                        value = constant
+                        idx += len(literal)
+                        break
+                else:
+                    raise ValueError(f"Unexpected character at offset {idx}")
+
+        # Store the value, closing every container it completes.
+        while True:
+            if not stack:
+                if _skip(text, idx) != len(text):
+                    raise ValueError(f"Extra data at offset {idx}")
+                return value
+            entry = stack[-1]
+            container = entry[0]
+            if isinstance(container, dict):
+                container[entry[1]] = value
+            else:
+                container.append(value)
+            idx = _skip(text, idx)
+            char = text[idx]
+            if char == ",":
+                idx = _skip(text, idx + 1)
+                if isinstance(container, dict):
+                    entry[1], idx = _read_key(text, idx)
+                break
+            if char != ("}" if isinstance(container, dict) else "]"):
+                raise ValueError(f"Expected ',' or a closing bracket at offset {idx}")
+            idx += 1
+            stack.pop()
+            value = container
+
+
+def iter_threads(path: Path) -> Iterator[Dict]:
+    """Yield every thread in a JSONL or ``.npz`` threads file, in file order."""
+    if not path.exists():
+        raise FileNotFoundError(f"Threads file not found: {path}")
+    if is_thread_store(path):
+        yield from ThreadStore(path)
+        return
+    for line in iter_lines(path):
+        if line.strip():
+            yield decode_thread(line)
+
+
+def load_thread(
+    path: Path,
+    *,
+    link_id: Optional[str] = None,
+    index: Optional[int] = None,
+) -> Dict:
+    """One thread from a JSONL or ``.npz`` threads file, by link_id or position."""
+    if not path.exists():
+        raise FileNotFoundError(f"Threads file not found: {path}")
+
+    if is_thread_store(path):
+        store = ThreadStore(path)
+        if link_id:
+            found = store.find(link_id)
+            if found is None:
+                raise ValueError(f"link_id {link_id} not found in {path}")
+            return store.thread(found)
+        assert index is not None and index >= 0
+        if index >= len(store):
+            raise IndexError(f"Index {index} is out of range for {path}")
+        return store.thread(index)
+
+    if link_id:
+        for line in iter_lines(path):
+            if not line.strip():
+                continue
+            if read_thread_header(line)["link_id"] == link_id:
+                return decode_thread(line)
+        raise ValueError(f"link_id {link_id} not found in {path}")
+
+    assert index is not None and index >= 0
+    for current_index, line in enumerate(iter_lines(path)):
+        if not line.strip():
+            continue
+        if current_index == index:
+            return decode_thread(line)
+
+    raise IndexError(f"Index {index} is out of range for {path}")
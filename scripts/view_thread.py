@@ -11,10 +11,8 @@ Usage examples:
 from __future__ import annotations
 
 import argparse
-import json
 import sys
 from pathlib import Path
-from typing import Dict, Optional
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = SCRIPT_DIR.parent
@@ -22,6 +20,7 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from scripts.thread_render import render_thread
+from scripts.thread_store import load_thread
 
 
 def parse_args() -> argparse.Namespace:
@@ -31,7 +30,8 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "threads_path",
         type=Path,
-        help="Path to the threads_<YYYY-MM>.jsonl output from reconstruct_threads.py.",
+        help="Path to the threads_<YYYY-MM>.jsonl (or .npz thread store) output "
+        "from reconstruct_threads.py.",
     )
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument(
@@ -42,7 +42,7 @@ def parse_args() -> argparse.Namespace:
     group.add_argument(
         "--index",
         type=int,
-        help="Zero-based index of the thread within the JSONL file.",
+        help="Zero-based index of the thread within the threads file.",
     )
     parser.add_argument(
         "--max-body-chars",
@@ -58,35 +58,6 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def load_thread(
-    path: Path,
-    *,
-    link_id: Optional[str] = None,
-    index: Optional[int] = None,
-) -> Dict:
-    if not path.exists():
-        raise FileNotFoundError(f"Threads file not found: {path}")
-
-    with path.open("r", encoding="utf-8") as handle:
-        if link_id:
-            for line_no, line in enumerate(handle):
-                if not line.strip():
-                    continue
-                record = json.loads(line)
-                if record["link_id"] == link_id:
-                    return record
-            raise ValueError(f"link_id {link_id} not found in {path}")
-
-        assert index is not None and index >= 0
-        for current_index, line in enumerate(handle):
-            if not line.strip():
-                continue
-            if current_index == index:
-                return json.loads(line)
-
-    raise IndexError(f"Index {index} is out of range for {path}")
-
-
 def main() -> None:
     args = parse_args()
     thread = load_thread(